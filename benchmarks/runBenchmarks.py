@@ -0,0 +1,399 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+import numpy as np
+import pandas as pd
+
+import contactStore
+import crm_v1
+import consolidateEmails
+import dataCleaning
+import emailCanon
+import listComparison
+import suppressionIndex
+from pipelineMetrics import METRICS
+from benchmarks import syntheticContacts
+
+# Offline benchmarks for the contact pipeline. Run from the repository root:
+#
+#   python -m benchmarks.runBenchmarks                      # 10k and 100k rows
+#   python -m benchmarks.runBenchmarks --sizes 1m --repeat 1
+#   python -m benchmarks.runBenchmarks --save-baseline      # record this machine's numbers
+#
+# Inputs come from syntheticContacts and are cached under benchmarks/data with
+# their columnar stores and suppression index already built, so every run
+# starts from the same warm state. Each benchmark runs in a fresh scratch
+# directory: timings are the best of --repeat runs without tracemalloc, and
+# peak memory comes from one extra run under tracemalloc, with a per-stage
+# breakdown from pipelineMetrics. Results are compared against
+# benchmarks/baselines.json, which only ever holds numbers measured by
+# --save-baseline; compare runs made on the same machine.
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCHMARK_DIR, 'data')
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, 'baselines.json')
+DEFAULT_SIZES = ['10k', '100k']
+DEFAULT_REPEAT = 3
+TOLERANCE = 0.10  # slower or bigger than the baseline by more than this counts as a regression
+SPLIT_LEVEL = 1400
+
+CONTACTS_FILE = 'contacts.xlsx'
+DO_NOT_EMAIL_FILE = 'DO NOT EMAIL.xlsx'
+SOURCE_ID, MASTER_ID, EXCLUDED_ID = 'source', 'master', 'excluded'
+
+class OfflineRequest:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def execute(self):
+        # Parsed on every call, like a real response body
+        return json.loads(self.payload)
+
+class OfflineSheets:
+    """The slice of the Sheets API consolidateEmails uses, answered from {spreadsheet id: {title: values}}."""
+
+    def __init__(self, spreadsheets):
+        self.tabs = spreadsheets
+        self.writes = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _values(self, spreadsheet_id, range_name):
+        return self.tabs[spreadsheet_id].get(range_name.split('!')[0].strip("'"), [])
+
+    def get(self, spreadsheetId, fields=None, range=None):
+        if range is not None:
+            return OfflineRequest(json.dumps({'range': range, 'values': self._values(spreadsheetId, range)}))
+        return OfflineRequest(json.dumps({'sheets': [{'properties': {'title': title}} for title in self.tabs[spreadsheetId]]}))
+
+    def batchGet(self, spreadsheetId, ranges):
+        return OfflineRequest(json.dumps({'valueRanges': [{'range': range_name, 'values': self._values(spreadsheetId, range_name)} for range_name in ranges]}))
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.writes += sum(len(data['values']) for data in body['data'])
+        return OfflineRequest(json.dumps({'totalUpdatedRows': self.writes}))
+
+    def clear(self, spreadsheetId, range, body=None):
+        return OfflineRequest(json.dumps({'clearedRange': range}))
+
+class Inputs:
+    """Generated inputs for one size, cached on disk and warmed once."""
+
+    def __init__(self, label, rows, seed = syntheticContacts.SEED):
+        self.label = label
+        self.rows = rows
+        self.seed = seed
+        self.directory = os.path.join(DATA_DIR, f"{label}-{seed}")
+        self.contacts_path = os.path.join(self.directory, CONTACTS_FILE)
+        self.do_not_email_path = os.path.join(self.directory, DO_NOT_EMAIL_FILE)
+        self._frame = None
+        self._sheets = None
+        self._spreadsheets = None
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = syntheticContacts.contactFrame(self.rows, self.seed)
+        return self._frame
+
+    def prepare(self):
+        if not os.path.exists(self.contacts_path) or not os.path.exists(self.do_not_email_path):
+            os.makedirs(self.directory, exist_ok = True)
+            print(f"Generating {self.rows} synthetic contacts in {self.directory}")
+            syntheticContacts.writeContactWorkbook(self.contacts_path, self.rows, self.seed)
+            syntheticContacts.writeDoNotEmailWorkbook(self.do_not_email_path, self.frame, self.seed)
+        with quiet():
+            contactStore.syncStore(self.contacts_path)
+            contactStore.syncStore(self.do_not_email_path)
+            suppressionIndex.getSuppressionIndex(self.do_not_email_path)
+
+    def sheets(self):
+        """The sourcing sheets as read by dataCleaning, as shallow copies so renaming columns never leaks between runs."""
+        if self._sheets is None:
+            with quiet():
+                self._sheets = contactStore.readSheets(self.contacts_path)
+        return [df.copy(deep = False) for df in self._sheets]
+
+    def spreadsheets(self):
+        if self._spreadsheets is None:
+            excluded = [['EMAIL']] + [[email] for email in syntheticContacts.doNotEmailList(self.frame, self.seed)]
+            self._spreadsheets = {
+                SOURCE_ID: syntheticContacts.consolidationTabs(self.frame, self.seed),
+                MASTER_ID: {'Master': []},
+                EXCLUDED_ID: {'Excluded': excluded},
+            }
+        return OfflineSheets(self._spreadsheets)
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+@contextlib.contextmanager
+def scratchDirectory(inputs):
+    """A fresh working directory linked to the warm inputs, with its own copy of the suppression index."""
+    previous = os.getcwd()
+    directory = tempfile.mkdtemp(prefix = 'contact-benchmark-')
+    try:
+        for name in (CONTACTS_FILE, DO_NOT_EMAIL_FILE):
+            source = os.path.join(inputs.directory, name)
+            os.symlink(source, os.path.join(directory, name))
+            os.symlink(contactStore.getStorePath(source), contactStore.getStorePath(os.path.join(directory, name)))
+        suppression = os.path.splitext(inputs.do_not_email_path)[0] + suppressionIndex.SUPPRESSION_SUFFIX
+        shutil.copytree(suppression, os.path.join(directory, os.path.basename(suppression)))
+        os.chdir(directory)
+        resetPipelineState()
+        yield directory
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(directory, ignore_errors = True)
+
+def resetPipelineState():
+    dataCleaning.GOOD_EMAILS = emailCanon.EmailSet()
+    dataCleaning.BAD_EMAILS = emailCanon.EmailSet()
+    dataCleaning.SUPPRESSION = None
+    suppressionIndex._INDEXES.clear()
+
+# Each benchmark is (setup, run): setup prepares arguments inside the scratch
+# directory and is not measured; run does the measured work and returns the rows it produced.
+
+def setupRead(inputs):
+    return CONTACTS_FILE
+
+def runRead(path):
+    return dataCleaning.countEntries(dataCleaning.getListOfDataFramesFromExcelFile(path))
+
+def setupExcelImport(inputs):
+    # A real copy of the workbook with no store next to it, so the Excel parse is measured
+    shutil.copy2(inputs.contacts_path, 'import.xlsx')
+    return 'import.xlsx'
+
+def runExcelImport(path):
+    return sum(len(df) for df in contactStore.importExcelToStore(path).values())
+
+def setupClean(inputs):
+    dataCleaning.useSuppressionIndex(DO_NOT_EMAIL_FILE)
+    return inputs.sheets()
+
+def runClean(list_of_dfs):
+    return dataCleaning.countEntries(dataCleaning.cleanListOfDataFrames(list_of_dfs))
+
+def cleanedMaster(inputs):
+    with quiet():
+        return dataCleaning.joinDataFrames(dataCleaning.cleanListOfDataFrames(setupClean(inputs)))
+
+def setupSplit(inputs):
+    return cleanedMaster(inputs)
+
+def runSplit(master_df):
+    return dataCleaning.countEntries(dataCleaning.splitDataFrame(master_df, SPLIT_LEVEL))
+
+def setupWrite(inputs):
+    with quiet():
+        return dataCleaning.splitDataFrame(cleanedMaster(inputs), SPLIT_LEVEL)
+
+def runWrite(list_of_dfs):
+    return dataCleaning.writeListOfDataFramesToExcelFile(list_of_dfs, 'base.xlsx')
+
+def setupCompareWorkbooks(inputs):
+    return CONTACTS_FILE, DO_NOT_EMAIL_FILE
+
+def runCompareWorkbooks(paths):
+    return len(listComparison.compareWorkbooks(*paths).both)
+
+def setupMergeAndFilter(inputs):
+    with quiet():
+        return consolidateEmails.fetch_data_from_all_sheets(SOURCE_ID, inputs.spreadsheets())
+
+def runMergeAndFilter(table):
+    merged, excluded = consolidateEmails.merge_and_filter(table)
+    return len(merged)
+
+def setupCreateNewBase(inputs):
+    return CONTACTS_FILE
+
+def runCreateNewBase(path):
+    dataCleaning.createNewBase(path, 'base.xlsx')
+    return METRICS.outputs['base.xlsx']['rows']
+
+def setupProcessWorkbook(inputs):
+    return CONTACTS_FILE
+
+def runProcessWorkbook(path):
+    # process_workbook reports nothing back, so there is no row count
+    crm_v1.process_workbook(path, 'summit.xlsx', DO_NOT_EMAIL_FILE)
+
+def setupConsolidate(inputs):
+    return inputs.spreadsheets()
+
+def runConsolidate(sheets):
+    consolidateEmails.consolidate(SOURCE_ID, MASTER_ID, EXCLUDED_ID, incremental = False, state_path = 'state.json', sheets_service = sheets)
+    return METRICS.outputs[consolidateEmails.MASTER_RANGE]['rows']
+
+def setupConsolidateRerun(inputs):
+    # A previous run's state is in place and nothing changed, so only the fetch and the digests are left
+    sheets = inputs.spreadsheets()
+    with quiet():
+        consolidateEmails.consolidate(SOURCE_ID, MASTER_ID, EXCLUDED_ID, state_path = 'state.json', sheets_service = sheets)
+    return sheets
+
+def runConsolidateRerun(sheets):
+    consolidateEmails.consolidate(SOURCE_ID, MASTER_ID, EXCLUDED_ID, state_path = 'state.json', sheets_service = sheets)
+    return METRICS.outputs[consolidateEmails.MASTER_RANGE]['rows']
+
+BENCHMARKS = {
+    # dataCleaning stages
+    'excel_import': (setupExcelImport, runExcelImport),
+    'read': (setupRead, runRead),
+    'clean': (setupClean, runClean),
+    'split': (setupSplit, runSplit),
+    'write': (setupWrite, runWrite),
+    'compare_workbooks': (setupCompareWorkbooks, runCompareWorkbooks),
+    # consolidateEmails
+    'merge_and_filter': (setupMergeAndFilter, runMergeAndFilter),
+    # Full flows
+    'createNewBase': (setupCreateNewBase, runCreateNewBase),
+    'process_workbook': (setupProcessWorkbook, runProcessWorkbook),
+    'consolidate': (setupConsolidate, runConsolidate),
+    'consolidate_rerun': (setupConsolidateRerun, runConsolidateRerun),
+}
+
+def runOnce(inputs, setup, run, trace_memory):
+    with scratchDirectory(inputs):
+        with quiet():
+            args = setup(inputs)
+        METRICS.reset()
+        if trace_memory:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            with quiet():
+                rows = run(args)
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - baseline if trace_memory else None
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+        return seconds, peak, rows, METRICS.report()['stages']
+
+def measure(inputs, name, repeat, trace_memory = True):
+    setup, run = BENCHMARKS[name]
+    best = None
+    for _ in range(repeat):
+        seconds, _, rows, stages = runOnce(inputs, setup, run, False)
+        if best is None or seconds < best['seconds']:
+            best = {'seconds': seconds, 'rows': rows, 'stages': {stage: {'seconds': stats['seconds']} for stage, stats in stages.items()}}
+    if trace_memory:
+        _, peak, _, stages = runOnce(inputs, setup, run, True)
+        best['peak_bytes'] = peak
+        for stage, stats in stages.items():
+            best['stages'].setdefault(stage, {})['peak_bytes'] = stats['peak_bytes']
+    return best
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+def loadBaselines(path = BASELINE_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def saveBaselines(results, path = BASELINE_FILE):
+    # Merged into what is there, so sizes can be recorded in separate runs
+    baselines = loadBaselines(path) or {'results': {}}
+    baselines['environment'] = environment()
+    baselines['recorded'] = time.strftime('%Y-%m-%d')
+    baselines['results'].update(results)
+    with open(path, 'w') as file:
+        json.dump(baselines, file, indent = 2, sort_keys = True)
+
+def change(value, baseline):
+    if value is None or not baseline:
+        return None
+    return value / baseline - 1
+
+def formatChange(ratio):
+    return '' if ratio is None else f"{ratio:+.0%}"
+
+def compare(results, baselines, tolerance = TOLERANCE):
+    """Print every result next to its baseline; returns the keys that regressed beyond tolerance."""
+    stored = (baselines or {}).get('results', {})
+    if baselines is None:
+        print("No baselines recorded yet; run with --save-baseline to record this machine's numbers.")
+    elif baselines.get('environment') != environment():
+        print("Warning: baselines were recorded in a different environment:", baselines.get('environment'))
+
+    regressions = []
+    print(f"{'benchmark':<28}{'rows':>10}{'seconds':>10}{'vs base':>9}{'peak MB':>10}{'vs base':>9}")
+    for key, result in results.items():
+        baseline = stored.get(key, {})
+        time_change = change(result['seconds'], baseline.get('seconds'))
+        memory_change = change(result.get('peak_bytes'), baseline.get('peak_bytes'))
+        peak = result.get('peak_bytes')
+        print(f"{key:<28}{result['rows'] if result['rows'] is not None else '':>10}{result['seconds']:>10.3f}{formatChange(time_change):>9}"
+              f"{peak / 2 ** 20 if peak is not None else float('nan'):>10.1f}{formatChange(memory_change):>9}")
+        if any(ratio is not None and ratio > tolerance for ratio in (time_change, memory_change)):
+            regressions.append(key)
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Offline benchmarks for the contact pipeline.')
+    parser.add_argument('--sizes', default = ','.join(DEFAULT_SIZES), help = 'comma-separated, from ' + ', '.join(syntheticContacts.SIZES))
+    parser.add_argument('--only', help = 'comma-separated benchmark names, from ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', type = int, default = DEFAULT_REPEAT)
+    parser.add_argument('--no-memory', action = 'store_true', help = 'skip the tracemalloc run')
+    parser.add_argument('--tolerance', type = float, default = TOLERANCE)
+    parser.add_argument('--baseline', default = BASELINE_FILE)
+    parser.add_argument('--save-baseline', action = 'store_true')
+    parser.add_argument('--output', help = 'also write the results as JSON here')
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(unknown))
+
+    results = {}
+    for label in args.sizes.split(','):
+        inputs = Inputs(label, syntheticContacts.SIZES[label])
+        inputs.prepare()
+        for name in names:
+            key = f"{name}[{label}]"
+            print(f"Running {key}", file = sys.stderr)
+            results[key] = measure(inputs, name, args.repeat, not args.no_memory)
+
+    regressions = compare(results, loadBaselines(args.baseline), args.tolerance)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'environment': environment(), 'results': results}, file, indent = 2, sort_keys = True)
+    if args.save_baseline:
+        saveBaselines(results, args.baseline)
+        print("Baselines saved to " + args.baseline)
+    elif regressions:
+        print(f"Regressions beyond {args.tolerance:.0%}: " + ', '.join(regressions))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
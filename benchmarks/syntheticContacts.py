@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from contactSchema import CANONICAL_FIELDS, canonical_field
+from dataCleaning import COMPANY_AVOID_LIST, EXCEL_WRITER_ENGINE
+
+# Deterministic synthetic contact lists for the benchmarks. The same (rows,
+# seed) always gives the same contacts, sheets and headers, so timings from
+# different runs and machines describe the same work. The data mimics the
+# sourcing workbooks: header spellings vary per sheet, most rows have no
+# MERGESTATUS yet, some bounced, and there are repeated emails (including
+# case/whitespace variants), invalid emails and avoid-list companies.
+
+SEED = 2024
+SIZES = {'10k': 10000, '100k': 100000, '1m': 1000000}
+
+# Spellings seen in the sourcing sheets; every one must resolve through contactSchema
+HEADER_VARIANTS = {
+    'NAME': ['NAME', 'Name', 'Full Name', 'FULL_NAME'],
+    'FIRST': ['FIRST', 'First', 'First Name', 'first_name'],
+    'EMAIL': ['EMAIL', 'Email', 'E-mail', 'Email Address'],
+    'COMPANY': ['COMPANY', 'Company', 'Company Name'],
+    'POSITION': ['POSITION', 'Position', 'Title', 'Job Title', 'Role'],
+    'MERGESTATUS': ['MERGESTATUS', 'Merge Status', 'MERGE_STATUS', 'Merge'],
+}
+EXTRA_COLUMNS = ['Notes', 'LinkedIn', 'Source']
+
+MERGE_STATUS_WEIGHTS = {
+    None: 0.50, 'EMAIL_SENT': 0.25, 'EMAIL_OPENED': 0.08, 'EMAIL_CLICKED': 0.04, 'BOUNCED': 0.05,
+    'RESPONDED': 0.02, 'UNSUBSCRIBED': 0.02, 'ERROR': 0.01, 'NO_RECIPIENT': 0.01, 'UNINTERESTED': 0.01, '0': 0.01,
+}
+DUPLICATE_RATE = 0.08    # rows repeating an earlier row's email, half of them in another case or padded
+INVALID_RATE = 0.03      # malformed addresses and bad top-level domains
+MISSING_RATE = 0.01      # rows with no email at all
+ROLE_RATE = 0.005        # info@, sales@, ...
+AVOID_RATE = 0.02        # rows at a COMPANY_AVOID_LIST company
+DO_NOT_EMAIL_RATE = 0.02 # share of emails already on the DO NOT EMAIL list
+SHEET_ROWS = (2000, 8000)
+ROWS_PER_COMPANY = 40
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Priya', 'Wei',
+               'Carlos', 'Fatima', 'Hiroshi', 'Olga', 'Ahmed', 'Chloe', 'Mateo', 'Aisha', 'Lukas', 'Ana']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+              'Lee', 'Patel', 'Nguyen', 'Kim', 'Chen', 'Singh', 'Kowalski', 'Rossi', 'Muller', 'Silva']
+POSITIONS = ['Software Engineer', 'Product Manager', 'Head of Growth', 'VP Marketing', 'Data Scientist',
+             'Chief Executive Officer', 'Founder', 'Director of Strategy', 'Sales Lead', 'Head of People',
+             'Commercial Strategy Manager', 'Brand Manager', 'Chief Technology Officer', 'Analyst', None]
+COMPANY_WORDS = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Stark', 'Wayne', 'Hooli', 'Vandelay', 'Soylent', 'Tyrell',
+                 'Cyberdyne', 'Wonka', 'Gringotts', 'Oscorp', 'Aperture', 'Massive', 'Dynamic', 'Pied Piper']
+COMPANY_SUFFIXES = ['Inc', 'Labs', 'Group', 'Systems', 'Partners', 'Health', 'Capital', 'Foods', 'AI', 'Co']
+ROLE_LOCAL_PARTS = ['info', 'sales', 'support', 'hello', 'team']
+
+for field, headers in HEADER_VARIANTS.items():
+    assert all(canonical_field(header) == field for header in headers), field
+
+def companyNames(count):
+    names = [f"{COMPANY_WORDS[n % len(COMPANY_WORDS)]} {COMPANY_SUFFIXES[n // len(COMPANY_WORDS) % len(COMPANY_SUFFIXES)]}"
+             for n in range(count)]
+    # Past the first few hundred the word combinations repeat, so number the rest
+    return [name if n < len(COMPANY_WORDS) * len(COMPANY_SUFFIXES) else f"{name} {n}" for n, name in enumerate(names)]
+
+def slug(text):
+    return ''.join(character for character in text.lower() if character.isalnum())
+
+def invalidEmail(local, domain, kind):
+    return (local + '.at.' + domain, local + '@' + domain.rsplit('.', 1)[0], local + ' x@' + domain,
+            local + '@' + domain + '.c0m', local + '@@' + domain)[kind]
+
+def contactFrame(rows, seed = SEED):
+    """rows contacts under the canonical column names, in sourcing order."""
+    rng = np.random.default_rng(seed)
+
+    company_count = max(50, rows // ROWS_PER_COMPANY)
+    weights = 1.0 / np.arange(1, company_count + 1) ** 1.1  # a few big companies, a long tail of small ones
+    company_ids = rng.choice(company_count, size = rows, p = weights / weights.sum())
+    names = companyNames(company_count)
+    companies = [names[n] for n in company_ids.tolist()]
+    avoid = np.flatnonzero(rng.random(rows) < AVOID_RATE)
+    for n, choice in zip(avoid.tolist(), rng.integers(0, len(COMPANY_AVOID_LIST), len(avoid)).tolist()):
+        companies[n] = COMPANY_AVOID_LIST[choice]
+
+    firsts = [FIRST_NAMES[n] for n in rng.integers(0, len(FIRST_NAMES), rows).tolist()]
+    lasts = [LAST_NAMES[n] for n in rng.integers(0, len(LAST_NAMES), rows).tolist()]
+    positions = [POSITIONS[n] for n in rng.integers(0, len(POSITIONS), rows).tolist()]
+
+    statuses = list(MERGE_STATUS_WEIGHTS)
+    probabilities = np.array(list(MERGE_STATUS_WEIGHTS.values()))
+    merge_statuses = [statuses[n] for n in rng.choice(len(statuses), size = rows, p = probabilities / probabilities.sum()).tolist()]
+
+    domains = [slug(company) + '.com' for company in companies]
+    local_parts = [f"{first.lower()}.{last.lower()}{n}" for n, (first, last) in enumerate(zip(firsts, lasts))]
+    emails = [local + '@' + domain for local, domain in zip(local_parts, domains)]
+
+    kind = rng.random(rows)
+    edges = np.cumsum([DUPLICATE_RATE, INVALID_RATE, MISSING_RATE, ROLE_RATE])
+    for n in np.flatnonzero(kind < edges[0]).tolist():
+        if n:
+            earlier = emails[int(rng.integers(0, n))]
+            variant = int(rng.integers(0, 4))
+            emails[n] = earlier if earlier is None or variant < 2 else (earlier.upper() if variant == 2 else ' ' + earlier + ' ')
+    for n in np.flatnonzero((kind >= edges[0]) & (kind < edges[1])).tolist():
+        emails[n] = invalidEmail(local_parts[n], domains[n], int(rng.integers(0, 5)))
+    for n in np.flatnonzero((kind >= edges[1]) & (kind < edges[2])).tolist():
+        emails[n] = None
+    for n in np.flatnonzero((kind >= edges[2]) & (kind < edges[3])).tolist():
+        emails[n] = ROLE_LOCAL_PARTS[int(rng.integers(0, len(ROLE_LOCAL_PARTS)))] + '@' + domains[n]
+
+    return pd.DataFrame({
+        'NAME': [first + ' ' + last for first, last in zip(firsts, lasts)],
+        'FIRST': firsts,
+        'EMAIL': emails,
+        'COMPANY': companies,
+        'POSITION': positions,
+        'MERGESTATUS': merge_statuses,
+    }, columns = list(CANONICAL_FIELDS))
+
+def sheetLayouts(rows, seed = SEED):
+    """(title, first row, last row, headers) per sheet: varying sizes, header spellings, column order and extras."""
+    rng = np.random.default_rng(seed + 1)
+    layouts, start, n = [], 0, 0
+    while start < rows:
+        stop = min(rows, start + int(rng.integers(*SHEET_ROWS)))
+        fields = list(CANONICAL_FIELDS)
+        rng.shuffle(fields)
+        headers = [(field, HEADER_VARIANTS[field][int(rng.integers(0, len(HEADER_VARIANTS[field])))]) for field in fields]
+        if rng.random() < 0.3:
+            headers.insert(int(rng.integers(0, len(headers) + 1)), (None, EXTRA_COLUMNS[int(rng.integers(0, len(EXTRA_COLUMNS)))]))
+        layouts.append(('Source ' + str(n + 1), start, stop, headers))
+        start, n = stop, n + 1
+    return layouts
+
+def iterSheets(df, seed = SEED):
+    """(title, DataFrame under that sheet's own headers) for every sheet of the sourcing workbook."""
+    for title, start, stop, headers in sheetLayouts(len(df), seed):
+        part = df.iloc[start:stop]
+        yield title, pd.DataFrame({header: part[field].to_numpy() if field else None for field, header in headers})
+
+def writeContactWorkbook(path, rows, seed = SEED):
+    df = contactFrame(rows, seed)
+    with pd.ExcelWriter(path, engine = EXCEL_WRITER_ENGINE) as writer:
+        for title, sheet in iterSheets(df, seed):
+            sheet.to_excel(writer, sheet_name = title, index = False)
+    return df
+
+def doNotEmailList(df, seed = SEED):
+    """Emails already on the DO NOT EMAIL list: a sample of the contacts plus addresses that never appear in them."""
+    rng = np.random.default_rng(seed + 2)
+    emails = df['EMAIL'].dropna()
+    sample = emails.iloc[np.flatnonzero(rng.random(len(emails)) < DO_NOT_EMAIL_RATE)].str.strip().str.lower()
+    unknown = [f"former.contact{n}@example.org" for n in range(max(1, len(sample) // 4))]
+    return sample.tolist() + unknown
+
+def writeDoNotEmailWorkbook(path, df, seed = SEED):
+    pd.DataFrame({'EMAIL': doNotEmailList(df, seed)}).to_excel(path, sheet_name = 'DO NOT EMAIL', index = False, engine = EXCEL_WRITER_ENGINE)
+
+def sheetValues(df, headers = None):
+    """A DataFrame as Sheets API values: header row first, blank cells as ''."""
+    headers = list(df.columns) if headers is None else headers
+    values = df.astype(object).where(df.notna(), '').values.tolist()
+    return [headers] + values
+
+def consolidationTabs(df, seed = SEED):
+    """The source spreadsheet for consolidateEmails, which skips its first two tabs, as {title: values}."""
+    tabs = {'Overview': [['Summary']], 'Template': [list(CANONICAL_FIELDS)]}
+    for title, sheet in iterSheets(df, seed):
+        tabs[title] = sheetValues(sheet)
+    return tabs
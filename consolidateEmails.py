@@ -1,178 +1,262 @@
 import os
-import pickle
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-
-creds = None
-if os.path.exists('token.pickle'):
-    with open('token.pickle', 'rb') as token:
-        creds = pickle.load(token)
-
-if not creds or not creds.valid:
-    if creds and creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file(
-            'client_secret_file.json', SCOPES)
-        creds = flow.run_local_server(port=8080)
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
-
-service = build('sheets', 'v4', credentials=creds)
-
-EXCLUDED_STATUS = ['BOUNCED', 'ERROR', '0', 'RESPONDI', 'NO_RECIPIENT', 'UNSUBSCRIBED', 'UNINTERESTED']
-
-# Define mappings for potential variations in header names
-HEADER_MAP = {
-    "name": "NAME",
-    "first": "FIRST",
-    "position": "POSITION",
-    "role" : "POSITION",
-    "email address": "EMAIL",
-    "email": "EMAIL",
-    "e-mail": "EMAIL",
-    "company" : "COMPANY",
-    "company name": "COMPANY",
-    "merge status" : "Merge status"
-}
-def fetch_data_from_sheet(sheet_id, range_name):
-    sheet = service.spreadsheets()
-    result = sheet.values().get(spreadsheetId=sheet_id, range=range_name).execute()
-    values = result.get('values', [])
-    
-    if not values:
-        return []
-    
-    headers = [header.strip().lower() for header in values[0]]
-
-    return [dict(zip(headers, row)) for row in values[1:]]
-
-def merge_and_filter(data_list):
+import re
+import json
+import hashlib
+import itertools
+import numpy as np
+import pandas as pd
+
+import googleClients
+from contactSchema import ContactTable
+from emailCanon import MISSING_KEY, EmailSet, emailKeys
+from pipelineMetrics import METRICS
+
+SCOPES = googleClients.SHEETS_SCOPES
+
+SOURCE_SHEET_ID = "1sOOXMQQd8denQQ7lrKv8tdBhT_adsBmXW4uCgQXghAI"
+MASTER_SHEET_ID = "1ZOKirGGwzL1ku8VzcF7JZmyxtw5TvBzFkIbuk8ahBSs"
+EXCLUDED_SHEET_ID = "1sWAtVHbSHA-BBfVywbPuPNQWbmPTT-JcikzMhkeBjrg"
+MASTER_RANGE = "Master!A:Z"
+EXCLUDED_RANGE = "Excluded!A:A"
+
+# Digests of the rows last written to Master/Excluded, for incremental runs; no contact data is kept
+STATE_FILE = 'consolidate_state.json'
+STATE_VERSION = 4  # Bumped when the state layout changes; older state is ignored
+ROW_DIGEST_SIZE = 8
+
+# Keep each values().batchUpdate body under Sheets' recommended 2 MB payload
+MAX_PAYLOAD_BYTES = 2 * 1024 * 1024
+
+EXCLUDED_STATUS = frozenset(['BOUNCED', 'ERROR', '0', 'RESPONDI', 'NO_RECIPIENT', 'UNSUBSCRIBED', 'UNINTERESTED'])
+
+def get_sheets_service():
+    # Built on first use and shared for the rest of the run, so importing this module does no auth or I/O
+    return googleClients.get_service('sheets', 'v4', SCOPES)
+
+def values_to_table(values):
+    """A ContactTable for a sheet's values, with the header row resolved to the canonical schema once."""
+    return ContactTable.from_values(values)
+
+def fetch_data_from_sheet(sheet_id, range_name, sheets_service=None):
+    sheet = (sheets_service or get_sheets_service()).spreadsheets()
+    result = METRICS.execute('sheets.values.get', sheet.values().get(spreadsheetId=sheet_id, range=range_name))
+    return values_to_table(result.get('values', []))
+
+def merge_and_filter(table):
+    """(first non-excluded row per email sorted by company, rows with an excluded status), as views of table."""
+    keys, statuses = email_keys(table).tolist(), table.columns['MERGESTATUS']
     merged_data = []
     excluded_data = []  # For data with excluded merge status
-    emails = set()
+    emails = set()  # emailCanon keys, so case and whitespace variants are one email
 
-    for data in data_list:
-        email = data.get('EMAIL')
-        merge_status = data.get('Merge status')
+    for index in table.indexes():
+        email = keys[index]
 
         if email not in emails:
-            if merge_status in EXCLUDED_STATUS:
-                excluded_data.append(data)
+            if statuses[index] in EXCLUDED_STATUS:
+                excluded_data.append(index)
                 continue
             emails.add(email)
-            merged_data.append(data)
-
-    return sorted(merged_data, key=lambda x: (x.get('Company') is None, x.get('Company'))), excluded_data
-
-def standardize_headers(data):
-    """Standardize headers based on mapping and handle missing fields."""
-    for record in data:
-        standardized_record = {}
-        for old_key, new_key in HEADER_MAP.items():
-            if old_key in record:
-                # Check if we're about to overwrite an existing field.
-                # If so, merge the values.
-                if new_key in standardized_record:
-                    standardized_record[new_key] = f"{standardized_record[new_key]} {record[old_key]}"
-                else:
-                    standardized_record[new_key] = record[old_key]
-
-        # Fill missing keys with default values
-        for key in HEADER_MAP.values():
-            standardized_record.setdefault(key, None)
-
-        # Replace the original record with the standardized one
-        record.clear()
-        record.update(standardized_record)
-
-    return data
-
-def fetch_data_from_all_sheets(sheet_id):
-    sheet_metadata = service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-    sheet_titles = [sheet['properties']['title'] for sheet in sheet_metadata['sheets']]
-    
-    all_data = []
-    for title in sheet_titles[2:]:  # Skip the first two sheets
-        range_name = f"{title}!A:Z"
-        sheet_data = fetch_data_from_sheet(sheet_id, range_name)
-        
-        # Standardize headers and handle missing ones
-        standardized_data = standardize_headers(sheet_data)
-        all_data.extend(standardized_data)
+            merged_data.append(index)
+
+    return table.take(merged_data).sorted_by('COMPANY'), table.take(excluded_data)
+
+def fetch_tab_values(sheet_id, sheets_service=None):
+    """(title, values) for every tab after the first two, from one metadata call and one values().batchGet."""
+    sheets = (sheets_service or get_sheets_service()).spreadsheets()
+    sheet_metadata = METRICS.execute('sheets.get', sheets.get(spreadsheetId=sheet_id, fields='sheets.properties.title'))
+    sheet_titles = [sheet['properties']['title'] for sheet in sheet_metadata['sheets']][2:]  # Skip the first two sheets
+
+    if not sheet_titles:
+        return []
+    ranges = [sheet_range(title, "A:Z") for title in sheet_titles]
+    result = METRICS.execute('sheets.values.batchGet', sheets.values().batchGet(spreadsheetId=sheet_id, ranges=ranges))
+    return [(title, value_range.get('values', [])) for title, value_range in zip(sheet_titles, result.get('valueRanges', []))]
+
+def fetch_data_from_all_sheets(sheet_id, sheets_service=None):
+    all_data = ContactTable()
+    for title, values in fetch_tab_values(sheet_id, sheets_service):
+        # Header variants are mapped to the canonical schema as the rows are read
+        all_data.extend_values(values)
         
     return all_data
 
-def filter_and_reorder_columns(data):
-    """Filter out unwanted columns and reorder them."""
-    desired_columns = ["NAME", "FIRST", "EMAIL", "COMPANY", "POSITION"]
-    reordered_data = []
-    
-    for record in data:
-        new_record = {col: record.get(col, "") for col in desired_columns}
-        reordered_data.append(new_record)
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            state = json.load(file)
+        if state.get('version') == STATE_VERSION:
+            return state
+    return {'version': STATE_VERSION, 'written': {}}
 
-    return reordered_data
+def save_state(state, path=STATE_FILE):
+    with open(path + '.tmp', 'w') as file:
+        json.dump(state, file)
+    os.replace(path + '.tmp', path)
 
-def write_to_sheet(data, sheet_id, range_name):
-    if not data:
+def filter_and_reorder_columns(data):
+    """Filter out unwanted columns and reorder them, as sheet rows under a header row."""
+    desired_columns = ("NAME", "FIRST", "EMAIL", "COMPANY", "POSITION")
+    return [[value if value is not None else "" for value in row] for row in data.to_rows(desired_columns)]
+
+def records_to_rows(data):
+    return data.rows()
+
+def row_digests(rows):
+    """One short digest per row, concatenated; this is all the state keeps of what was written."""
+    digests = bytearray()
+    for row in rows:
+        digests += hashlib.blake2b(json.dumps(row).encode('utf-8'), digest_size=ROW_DIGEST_SIZE).digest()
+    return bytes(digests)
+
+def sheet_range(title, cells):
+    # A1 notation quotes the title, doubling any apostrophe in it: ("Bob's", 'A:Z') -> "'Bob''s'!A:Z"
+    return "'" + title.replace("'", "''") + "'!" + cells
+
+def parse_range(range_name):
+    # 'Master!A:Z' -> ('Master', 'A', 'Z'); a quoted title is unquoted
+    title, cells = range_name.rsplit('!', 1)
+    if len(title) > 1 and title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    columns = re.findall(r'[A-Za-z]+', cells)
+    return title, columns[0], columns[-1]
+
+def write_row_runs(runs, sheet_id, title, start_column, sheets_service=None):
+    """Write (first row number, rows) runs, packing their ranges into batchUpdates of at most MAX_PAYLOAD_BYTES."""
+    values = (sheets_service or get_sheets_service()).spreadsheets().values()
+
+    def send(data):
+        body = {'valueInputOption': 'RAW', 'data': data}
+        METRICS.execute('sheets.values.batchUpdate', values.batchUpdate(spreadsheetId=sheet_id, body=body))
+
+    data, size = [], 0
+    for row_number, rows in runs:
+        current = None
+        for row in rows:
+            # Sheets skips nulls in RAW writes, which would leave a rewritten row's old cells in place, so blank them explicitly
+            row = [value if value is not None else "" for value in row]
+            row_size = len(json.dumps(row)) + 1
+            if data and size + row_size > MAX_PAYLOAD_BYTES:
+                send(data)
+                data, size, current = [], 0, None
+            if current is None:
+                current = {'range': sheet_range(title, f"{start_column}{row_number}"), 'values': []}
+                data.append(current)
+            current['values'].append(row)
+            size += row_size
+            row_number += 1
+    if data:
+        send(data)
+
+def write_rows(rows, sheet_id, title, start_column, start_row=1, sheets_service=None):
+    write_row_runs([(start_row, rows)], sheet_id, title, start_column, sheets_service)
+
+def changed_runs(digests, previous_digests):
+    """(start, stop) row ranges whose digest differs from the one previously at the same position."""
+    current, previous = np.frombuffer(digests, dtype='<u8'), np.frombuffer(previous_digests, dtype='<u8')
+    shared = min(len(current), len(previous))
+    changed = np.ones(len(current), dtype=bool)
+    changed[:shared] = current[:shared] != previous[:shared]
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], changed, [False]]).astype(np.int8)))
+    return list(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+
+def write_to_sheet(data, sheet_id, range_name, sheets_service=None):
+    if not len(data):
         print("Warning: Trying to write an empty dataset. Skipping...")
         return
-    headers = list(data[0].keys())
-    rows = [[record.get(key, "") for key in headers] for record in data]
-    sheet = service.spreadsheets()
-    sheet.values().update(spreadsheetId=sheet_id, range=range_name, valueInputOption='RAW', body={"values": [headers] + rows}).execute()
+    title, start_column, _ = parse_range(range_name)
+    write_rows(records_to_rows(data), sheet_id, title, start_column, 1, sheets_service)
+
+def write_rows_diff(rows, previous_digests, sheet_id, range_name, sheets_service=None):
+    """Bring a sheet whose rows had previous_digests (from row_digests) up to rows.
+
+    rows may be any re-iterable, such as ContactTable.rows(); it is walked once
+    to digest and once to write. Only rows whose digest differs from the one at
+    the same position last time are rewritten, and any leftover tail is
+    cleared: an edit costs its own rows and an append the new ones, but an
+    inserted or deleted row shifts, and so rewrites, every row after it.
+    previous_digests=None rewrites all. Returns (rows written or cleared, digests of rows).
+    """
+    digests = row_digests(rows)
+    title, start_column, end_column = parse_range(range_name)
+    if previous_digests is None:
+        write_rows(rows, sheet_id, title, start_column, 1, sheets_service)
+        return len(rows), digests
+
+    runs = changed_runs(digests, previous_digests)
+    iterator = iter(rows)
+
+    def runs_of_rows():
+        position = 0
+        for start, stop in runs:
+            next(itertools.islice(iterator, start - position, start - position), None)  # Skip the unchanged rows
+            yield start + 1, itertools.islice(iterator, stop - start)
+            position = stop
+
+    if runs:
+        write_row_runs(runs_of_rows(), sheet_id, title, start_column, sheets_service)
+    count, previous_count = len(digests) // ROW_DIGEST_SIZE, len(previous_digests) // ROW_DIGEST_SIZE
+    if previous_count > count:
+        clear_range = sheet_range(title, f"{start_column}{count + 1}:{end_column}{previous_count}")
+        values = (sheets_service or get_sheets_service()).spreadsheets().values()
+        METRICS.execute('sheets.values.clear', values.clear(spreadsheetId=sheet_id, range=clear_range, body={}))
+    return sum(stop - start for start, stop in runs) + max(0, previous_count - count), digests
+
+def email_keys(table):
+    """emailCanon keys for every underlying row of table, MISSING_KEY where there is no email."""
+    return emailKeys(table.columns['EMAIL'])
 
 def get_emails_from_data(data):
-    """Extract emails from the provided data."""
-    return {record['EMAIL'] for record in data if 'EMAIL' in record}
+    """Extract emails from the provided data, as an EmailSet of canonical emails."""
+    return EmailSet(data.column('EMAIL'))
+
+def consolidate(source_id, master_id, excluded_id, incremental=True, state_path=STATE_FILE, sheets_service=None):
+    """Rebuild Master and Excluded from the source tabs.
+
+    With incremental=True, only the rows that differ from what the previous run
+    wrote at the same position are sent to the sheets, see write_rows_diff.
+    """
+    state = load_state(state_path) if incremental else {'version': STATE_VERSION, 'written': {}}
 
-if __name__ == "__main__":
     # Fetching data from the source sheets
-    data_from_source_sheet = fetch_data_from_all_sheets("1sOOXMQQd8denQQ7lrKv8tdBhT_adsBmXW4uCgQXghAI")
+    with METRICS.stage('read') as stage:
+        data_from_source_sheet = fetch_data_from_all_sheets(source_id, sheets_service)
+        stage.rows_out = len(data_from_source_sheet)
     
     print(f"Initial data size from source: {len(data_from_source_sheet)}")  # Debugging line
 
-    final_data_to_write = []
-    excluded_data = []
+    # Rows are only ever selected by index, never copied, and emails are compared by canonical key
+    keys = email_keys(data_from_source_sheet)
+    with_email = data_from_source_sheet.select(keys != MISSING_KEY)
 
-    for record in data_from_source_sheet:
-        email = record.get('EMAIL')
-        merge_status = record.get('Merge status')
+    # If email has a bad status, exclude it
+    bad_status = pd.Series(data_from_source_sheet.columns['MERGESTATUS'], dtype=object).isin(EXCLUDED_STATUS).to_numpy()
+    excluded_data = with_email.select(bad_status)
+    final_data_to_write = with_email.select(~bad_status)
 
-        if not email:
-            continue
-
-        # If email has a bad status, exclude it
-        if merge_status in EXCLUDED_STATUS:
-            excluded_data.append(record)
-        else:
-            final_data_to_write.append(record)
-
-    # Fetch existing data from 'Excluded' Sheet
-    # Fetch data and standardize headers using HEADER_MAP
-    excluded_data_from_sheet = fetch_data_from_sheet("1sWAtVHbSHA-BBfVywbPuPNQWbmPTT-JcikzMhkeBjrg", "Excluded!A:Z")
-    standardized_excluded_data = [{HEADER_MAP.get(k.strip().lower(), k): v for k, v in record.items()} for record in excluded_data_from_sheet]
+    # Fetch existing data from 'Excluded' Sheet, its header mapped to the canonical schema
+    excluded_data_from_sheet = fetch_data_from_sheet(excluded_id, "Excluded!A:Z", sheets_service)
     
-    print(f"Excluded data size from sheet: {len(standardized_excluded_data)}")  # Debugging line
+    print(f"Excluded data size from sheet: {len(excluded_data_from_sheet)}")  # Debugging line
 
-    # Create set of existing excluded emails, assuming standardized header is 'EMAIL'
-    existing_excluded_emails = {record.get('EMAIL') for record in standardized_excluded_data if 'EMAIL' in record}
+    # Create set of existing excluded emails, in the order the sheet lists them
+    existing_excluded_emails = get_emails_from_data(excluded_data_from_sheet)
+    existing_count = len(existing_excluded_emails)
 
     # Extracting the new excluded emails
-    new_excluded_emails = {record['EMAIL'] for record in excluded_data}
+    new_excluded_emails = get_emails_from_data(excluded_data)
     
     # Combine and deduplicate the new excluded emails with the existing ones
-    all_excluded_emails = existing_excluded_emails.union(new_excluded_emails)
+    all_excluded_emails = existing_excluded_emails
+    all_excluded_emails.update(new_excluded_emails)
 
     # Capture the count before removal for comparison
     initial_count = len(final_data_to_write)
 
-    # Ensure 'Master' does not contain excluded emails
-    final_data_to_write = [data for data in final_data_to_write if data['EMAIL'] not in all_excluded_emails]
+    # Ensure 'Master' does not contain excluded emails, looked up by key in the set already in memory
+    with METRICS.stage('filter', initial_count) as stage:
+        final_data_to_write = final_data_to_write.select(~all_excluded_emails.containsKeys(keys))
+        stage.rows_out = len(final_data_to_write)
 
     # Calculate the difference in count and print it
     removed_count = initial_count - len(final_data_to_write)
@@ -180,9 +264,35 @@ if __name__ == "__main__":
 
     print(f"Data to be written to Master Sheet: {len(final_data_to_write)} records")  # To show the total number of records
 
-    # Writing to Master Sheet
-    write_to_sheet(final_data_to_write, "1ZOKirGGwzL1ku8VzcF7JZmyxtw5TvBzFkIbuk8ahBSs", "Master!A:Z")
+    written = {key: bytes.fromhex(digests) for key, digests in state['written'].items()} if incremental else {}
 
-    # Writing combined excluded emails to the 'Excluded' sheet (convert set back to the desired list format)
-    combined_excluded_data = [{"EMAIL": email} for email in all_excluded_emails]
-    write_to_sheet(combined_excluded_data, "1sWAtVHbSHA-BBfVywbPuPNQWbmPTT-JcikzMhkeBjrg", "Excluded!A:A")
\ No newline at end of file
+    # Writing to Master Sheet, only the rows that changed since the last run; an empty result leaves it alone
+    master_digests = written.get(MASTER_RANGE)
+    if not len(final_data_to_write):
+        print("Warning: Trying to write an empty dataset. Skipping...")
+    else:
+        with METRICS.stage('write', len(final_data_to_write)) as stage:
+            updated, master_digests = write_rows_diff(records_to_rows(final_data_to_write), master_digests, master_id, MASTER_RANGE, sheets_service)
+            stage.rows_out = updated
+        METRICS.record_output(MASTER_RANGE, len(final_data_to_write))
+        print(f"Master rows written or cleared: {updated}")
+
+    # Writing combined excluded emails to the 'Excluded' sheet: the sheet's own emails keep their order, new ones are appended sorted
+    all_excluded_list = list(all_excluded_emails)
+    ordered_excluded = all_excluded_list[:existing_count] + sorted(all_excluded_list[existing_count:])
+    excluded_rows = [["EMAIL"]] + [[email] for email in ordered_excluded]
+    with METRICS.stage('write', len(ordered_excluded)) as stage:
+        updated, excluded_digests = write_rows_diff(excluded_rows, written.get(EXCLUDED_RANGE), excluded_id, EXCLUDED_RANGE, sheets_service)
+        stage.rows_out = updated
+    METRICS.record_output(EXCLUDED_RANGE, len(ordered_excluded))
+    print(f"Excluded rows written or cleared: {updated}")
+
+    state['written'] = {EXCLUDED_RANGE: excluded_digests.hex()}
+    if master_digests is not None:
+        state['written'][MASTER_RANGE] = master_digests.hex()
+    save_state(state, state_path)
+    METRICS.write_report()
+
+
+if __name__ == "__main__":
+    consolidate(SOURCE_SHEET_ID, MASTER_SHEET_ID, EXCLUDED_SHEET_ID)
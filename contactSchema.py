@@ -0,0 +1,212 @@
+import re
+import sys
+from array import array
+from collections import namedtuple
+import numpy as np
+
+# Canonical contact schema shared by dataCleaning, crm_v1 and consolidateEmails.
+# Header aliases are resolved once per sheet from its header row; rows are then
+# projected by column index into compact ContactRecord tuples (or straight into
+# a column-oriented ContactTable), and DataFrames simply get their columns renamed.
+
+CANONICAL_FIELDS = ('NAME', 'FIRST', 'EMAIL', 'COMPANY', 'POSITION', 'MERGESTATUS')
+
+# Keys are headers lower-cased with everything but letters and digits removed,
+# so 'E-mail', 'Email Address' and 'MERGE_STATUS' all resolve.
+HEADER_ALIASES = {
+    'name': 'NAME',
+    'fullname': 'NAME',
+    'first': 'FIRST',
+    'firstname': 'FIRST',
+    'email': 'EMAIL',
+    'emailaddress': 'EMAIL',
+    'company': 'COMPANY',
+    'companyname': 'COMPANY',
+    'position': 'POSITION',
+    'role': 'POSITION',
+    'title': 'POSITION',
+    'jobtitle': 'POSITION',
+    'merge': 'MERGESTATUS',
+    'mergestatus': 'MERGESTATUS',
+}
+
+ContactRecord = namedtuple('ContactRecord', CANONICAL_FIELDS)
+
+def alias_key(header):
+    return re.sub(r'[^a-z0-9]', '', str(header).lower())
+
+def canonical_field(header):
+    """The canonical field a header maps to, or None."""
+    return HEADER_ALIASES.get(alias_key(header))
+
+def resolve_columns(headers):
+    """Map each canonical field to the indexes of the header columns that alias it, in header order."""
+    mapping = {field: [] for field in CANONICAL_FIELDS}
+    for index, header in enumerate(headers):
+        field = canonical_field(header)
+        if field is not None:
+            mapping[field].append(index)
+    return mapping
+
+def iter_records(rows, mapping):
+    """Turn raw sheet rows into ContactRecords using a mapping from resolve_columns.
+
+    Missing fields are None; when several columns alias one field their non-empty
+    values are joined with a space.
+    """
+    # Absent fields point past any row; Sheets also drops trailing empty cells, so short rows read None
+    positions = [indexes[0] if indexes else sys.maxsize for indexes in mapping.values()]
+    merged = [(n, indexes) for n, indexes in enumerate(mapping.values()) if len(indexes) > 1]
+
+    for row in rows:
+        size = len(row)
+        values = [row[position] if position < size else None for position in positions]
+        for n, indexes in merged:
+            parts = [str(row[index]) for index in indexes if index < size and row[index] not in (None, '')]
+            values[n] = ' '.join(parts) if parts else values[n]
+        yield ContactRecord._make(values)
+
+def frame_column_name(column):
+    """Canonical name for a DataFrame column, or the old spaces-removed upper-case form for unknown ones."""
+    return canonical_field(column) or str(column).replace(' ', '').upper()
+
+def rename_frame_columns(df):
+    """Rename a DataFrame's columns to the canonical schema.
+
+    Only the first column aliasing a field takes its canonical name, so a sheet
+    with both 'Email' and 'Email Address' never ends up with duplicate columns.
+    Later aliases keep their original header instead, numbered if even that is
+    taken, since the usual upper-cased form of 'Email' would be 'EMAIL' again.
+    """
+    fields = [canonical_field(column) for column in df.columns]
+    columns, taken = [], set()
+    for column, field in zip(df.columns, fields):
+        if field is not None and field not in taken:
+            name = field
+        elif field is None:
+            name = str(column).replace(' ', '').upper()
+        else:
+            name = str(column)
+        # Never shadow a canonical field, even one a later column will claim
+        base, n = name, 1
+        while name in taken or (name != field and name in CANONICAL_FIELDS):
+            n += 1
+            name = base + '_' + str(n)
+        taken.add(name)
+        columns.append(name)
+    df.columns = columns
+    return df
+
+class ContactTable:
+    """Column-oriented contacts: one list per canonical field, plus an optional row selection.
+
+    Filtering returns a view over the same columns holding only an array of row
+    indexes, so narrowing a big table never copies the contacts themselves.
+    MERGESTATUS values are interned, so every 'BOUNCED' is the same string.
+    """
+
+    __slots__ = ('columns', 'selection')
+
+    def __init__(self, columns=None, selection=None):
+        self.columns = columns if columns is not None else {field: [] for field in CANONICAL_FIELDS}
+        self.selection = selection  # None means every row, otherwise a range or array('q') of row indexes
+
+    @classmethod
+    def from_values(cls, values):
+        """A table from a sheet's values, the header row resolved once."""
+        table = cls()
+        table.extend_values(values)
+        return table
+
+    def extend_values(self, values):
+        """Append a sheet's values (header row first), projected straight into the columns."""
+        self._check_extendable()
+        start = len(self)
+        columns_from_values(values, self.columns)
+        self._intern_statuses(start)
+
+    def extend_columns(self, columns):
+        self._check_extendable()
+        start = len(self)
+        for field in CANONICAL_FIELDS:
+            self.columns[field].extend(columns[field])
+        self._intern_statuses(start)
+
+    def _check_extendable(self):
+        if self.selection is not None:
+            raise ValueError("cannot extend a filtered view")
+
+    def _intern_statuses(self, start):
+        statuses = self.columns['MERGESTATUS']
+        for index in range(start, len(statuses)):
+            if isinstance(statuses[index], str):
+                statuses[index] = sys.intern(statuses[index])
+
+    def __len__(self):
+        return len(self.columns['EMAIL']) if self.selection is None else len(self.selection)
+
+    def indexes(self):
+        return range(len(self.columns['EMAIL'])) if self.selection is None else self.selection
+
+    def column(self, field):
+        values = self.columns[field]
+        return values if self.selection is None else [values[index] for index in self.selection]
+
+    def take(self, indexes):
+        """A view of the underlying rows at indexes (which must come from this table's indexes())."""
+        return ContactTable(self.columns, array('q', indexes))
+
+    def select(self, mask):
+        """A view of the selected rows whose entry in mask (a boolean array over the underlying rows) is true."""
+        indexes = np.arange(len(self.columns['EMAIL'])) if self.selection is None else np.asarray(self.selection, dtype = np.int64)
+        selection = array('q')
+        selection.frombytes(indexes[np.asarray(mask, dtype = bool)[indexes]].astype(np.int64).tobytes())
+        return ContactTable(self.columns, selection)
+
+    def view(self, rows):
+        """A view of a range of underlying rows, without materializing any indexes."""
+        return ContactTable(self.columns, rows)
+
+    def where(self, predicate):
+        """A view of the rows for which predicate(row index) is true."""
+        return self.take(index for index in self.indexes() if predicate(index))
+
+    def sorted_by(self, field):
+        values = self.columns[field]
+        return self.take(sorted(self.indexes(), key=lambda index: (values[index] is None, values[index] or '')))
+
+    def rows(self, fields=CANONICAL_FIELDS):
+        """The selected rows as sheet rows under a header row, built lazily."""
+        return TableRows(self, fields)
+
+    def to_rows(self, fields=CANONICAL_FIELDS):
+        return list(self.rows(fields))
+
+class TableRows:
+    """Re-iterable header-plus-rows of a ContactTable; each row list exists only while it is consumed."""
+
+    __slots__ = ('table', 'fields')
+
+    def __init__(self, table, fields=CANONICAL_FIELDS):
+        self.table = table
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.table) + 1
+
+    def __iter__(self):
+        yield list(self.fields)
+        columns = [self.table.columns[field] for field in self.fields]
+        for index in self.table.indexes():
+            yield [values[index] for values in columns]
+
+def columns_from_values(values, columns=None):
+    """A sheet's values (header row first) as one list per canonical field, appended to columns if given."""
+    if columns is None:
+        columns = {field: [] for field in CANONICAL_FIELDS}
+    if values:
+        appends = [columns[field].append for field in CANONICAL_FIELDS]
+        for record in iter_records(values[1:], resolve_columns(values[0])):
+            for append, value in zip(appends, record):
+                append(value)
+    return columns
@@ -0,0 +1,126 @@
+import os
+import json
+import importlib.util
+import pandas as pd
+import contactSchema
+
+# Columnar mirror of the contact workbooks. Every workbook gets a sibling
+# '<name>.store' directory holding one Parquet file per sheet and a manifest
+# recording the size/mtime of the .xlsx it was built from. Excel is only parsed
+# when the workbook changes; everything else reads the Parquet files, and only
+# the columns it asks for.
+
+STORE_SUFFIX = '.store'
+MANIFEST_NAME = 'manifest.json'
+STORE_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+def normalizeColumnName(column):
+    return contactSchema.frame_column_name(column)
+
+def getStorePath(excel_path):
+    return os.path.splitext(excel_path)[0] + STORE_SUFFIX
+
+def getExcelSignature(excel_path):
+    stat = os.stat(excel_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def readManifest(excel_path):
+    manifest_path = os.path.join(getStorePath(excel_path), MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as file:
+        return json.load(file)
+
+def isStoreCurrent(excel_path):
+    manifest = readManifest(excel_path)
+    return manifest is not None and manifest['source'] == getExcelSignature(excel_path)
+
+def _prepareForParquet(df):
+    # Excel columns routinely mix numbers and text (e.g. a MERGE STATUS of 0),
+    # which Arrow refuses to store in a single column, so text it up here.
+    df = df.rename(columns = str)
+    for column in df.columns[df.dtypes == object]:
+        values = df[column]
+        if not values.map(lambda v: isinstance(v, str) or pd.isna(v)).all():
+            df[column] = values.map(lambda v: v if isinstance(v, str) or pd.isna(v) else str(v))
+    return df
+
+def writeStore(list_of_dfs, excel_path, sheet_names, signature = None):
+    if not STORE_AVAILABLE:
+        return
+    if signature is None:
+        signature = getExcelSignature(excel_path)
+    store_path = getStorePath(excel_path)
+    os.makedirs(store_path, exist_ok = True)
+
+    sheets = []
+    for n, (df, sheet_name) in enumerate(zip(list_of_dfs, sheet_names)):
+        file_name = str(n) + '.parquet'
+        _prepareForParquet(df).to_parquet(os.path.join(store_path, file_name), index = False)
+        sheets.append({'name': sheet_name, 'file': file_name, 'rows': len(df)})
+
+    # Written last so a crash mid-import leaves the store looking stale.
+    with open(os.path.join(store_path, MANIFEST_NAME), 'w') as file:
+        json.dump({'source': signature, 'sheets': sheets}, file, indent = 2)
+
+def importExcelToStore(excel_path):
+    signature = getExcelSignature(excel_path)
+    file = pd.ExcelFile(excel_path)
+    sheets = pd.read_excel(file, file.sheet_names)
+    writeStore(list(sheets.values()), excel_path, list(sheets.keys()), signature)
+    return sheets
+
+def syncStore(excel_path):
+    if STORE_AVAILABLE and not isStoreCurrent(excel_path):
+        print("Importing " + excel_path + " into columnar store.")
+        importExcelToStore(excel_path)
+    return readManifest(excel_path)
+
+def _selectColumns(parquet_path, columns):
+    import pyarrow.parquet as pq
+    wanted = {normalizeColumnName(column) for column in columns}
+    return [name for name in pq.read_schema(parquet_path).names if normalizeColumnName(name) in wanted]
+
+def readSheets(excel_path, columns = None):
+    """Return every sheet of the workbook as a list of DataFrames.
+
+    columns is matched on contactSchema's canonical names, so ['MERGESTATUS']
+    picks up a 'Merge Status' or 'Merge' column. Unknown columns are ignored.
+    """
+    if not STORE_AVAILABLE:
+        file = pd.ExcelFile(excel_path)
+        list_of_dfs = list(pd.read_excel(file, file.sheet_names).values())
+        if columns is not None:
+            wanted = {normalizeColumnName(column) for column in columns}
+            list_of_dfs = [df[[c for c in df.columns if normalizeColumnName(c) in wanted]] for df in list_of_dfs]
+        return list_of_dfs
+
+    manifest = syncStore(excel_path)
+    store_path = getStorePath(excel_path)
+    list_of_dfs = []
+    for sheet in manifest['sheets']:
+        parquet_path = os.path.join(store_path, sheet['file'])
+        selected = None if columns is None else _selectColumns(parquet_path, columns)
+        list_of_dfs.append(pd.read_parquet(parquet_path, columns = selected))
+    return list_of_dfs
+
+def getSheetNames(excel_path):
+    if not STORE_AVAILABLE:
+        return pd.ExcelFile(excel_path).sheet_names
+    return [sheet['name'] for sheet in syncStore(excel_path)['sheets']]
+
+def countRows(excel_path):
+    if not STORE_AVAILABLE:
+        return sum(len(df) for df in readSheets(excel_path))
+    return sum(sheet['rows'] for sheet in syncStore(excel_path)['sheets'])
+
+def exportStoreToExcel(excel_path, output_path = None):
+    """Write the stored sheets back out as a workbook (defaults to the source path)."""
+    output_path = output_path or excel_path
+    list_of_dfs = readSheets(excel_path)
+    sheet_names = getSheetNames(excel_path)
+    with pd.ExcelWriter(output_path, engine = 'openpyxl') as writer:
+        for df, sheet_name in zip(list_of_dfs, sheet_names):
+            df.to_excel(writer, sheet_name = sheet_name, index = False)
+    if os.path.abspath(output_path) == os.path.abspath(excel_path):
+        writeStore(list_of_dfs, excel_path, sheet_names)
@@ -1,134 +1,343 @@
+import numpy as np
 import pandas as pd
 import os
 import time
 import warnings
 import re
+import importlib.util
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from email.utils import parseaddr
+from openpyxl import Workbook, load_workbook
+import contactSchema
+import contactStore
+import emailCanon
+import suppressionIndex
+import emailValidation
+import listComparison
+import sheetPartitioner
+from pipelineMetrics import METRICS
 
 warnings.simplefilter(action='ignore', category = FutureWarning)
 
 MERGE_KEEP_LIST = ['EMAIL_SENT', 'EMAIL_CLICKED', 'EMAIL_OPENED', '', None]
 MERGE_DROP_LIST = ['BOUNCED', 'ERROR', '0', 'RESPONDED', 'NO_RECIPIENT', 'UNSUBSCRIBED', 'UNINTERESTED']
 
-GOOD_EMAILS = set()
-BAD_EMAILS = set()
-COLUMNS_WANTED = ['COMPANY', 'NAME', 'FIRST', 'EMAIL', 'ROLE', 'MERGE']
+# Canonical emails keyed by 64-bit hash, see emailCanon. BAD_EMAILS only holds
+# bounces found in this run; the DO NOT EMAIL list itself is checked through
+# SUPPRESSION, its memory-mapped suppressionIndex, without being loaded.
+GOOD_EMAILS = emailCanon.EmailSet()
+BAD_EMAILS = emailCanon.EmailSet()
+SUPPRESSION = None
+COLUMNS_WANTED = ['COMPANY', 'NAME', 'FIRST', 'EMAIL', 'POSITION', 'MERGESTATUS']
+STREAM_COLUMNS = COLUMNS_WANTED
+STREAM_CHUNK_SIZE = 5000
 
 COMPANY_AVOID_LIST = ['Facebook', 'Y Combinator', 'Instagram', 'Meta', 'Whatsapp', 'Oculus']
 
-def getDataFrameFromExcelFile(file_path):
-    return pd.read_excel(pd.ExcelFile(file_path))
+# xlsxwriter streams new workbooks much faster and leaner than openpyxl; openpyxl is still needed to append.
+EXCEL_WRITER_ENGINE = 'xlsxwriter' if importlib.util.find_spec('xlsxwriter') else 'openpyxl'
+SHEET_NAME_MAX_LENGTH = 31
+SHEET_NAME_INVALID_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+def getDataFrameFromExcelFile(file_path, columns = None):
+    return contactStore.readSheets(file_path, columns)[0]
 
 def writeDataFrameToExcelFile(df, file_path, sheet_title):
-    writer = pd.ExcelWriter(file_path, engine = 'openpyxl', mode = 'w')
-    df.to_excel(writer, sheet_name = sheet_title, index = False)
-    writer.save()
+    with METRICS.stage('write', len(df)):
+        with pd.ExcelWriter(file_path, engine = EXCEL_WRITER_ENGINE, mode = 'w') as writer:
+            df.to_excel(writer, sheet_name = sheet_title, index = False)
+        contactStore.writeStore([df], file_path, [sheet_title])
+    METRICS.record_output(file_path, len(df), 1)
+    return len(df)
 
 def addDataFrameToExistingExcelFile(df, file_path, sheet_name):
     if os.path.exists(file_path):
-        writer = pd.ExcelWriter(file_path, engine = 'openpyxl', mode = 'a', if_sheet_exists = 'replace')
-        df.to_excel(writer, sheet_name = sheet_name, index = False)
-        writer.save()
+        with pd.ExcelWriter(file_path, engine = 'openpyxl', mode = 'a', if_sheet_exists = 'replace') as writer:
+            df.to_excel(writer, sheet_name = sheet_name, index = False)
+
+def makeSheetName(founder, company, n):
+    # Excel caps sheet names at 31 characters and rejects []:*?/\, so trim the company to fit.
+    prefix, suffix = founder + ' ', ' ' + str(n)
+    company = SHEET_NAME_INVALID_CHARS.sub('', str(company))
+    return prefix + company[:SHEET_NAME_MAX_LENGTH - len(prefix) - len(suffix)] + suffix
 
 def writeListOfDataFramesToExcelFile(list_of_dfs, file_path):
-    for n, df in enumerate(list_of_dfs):
-        most_common_company = df['COMPANY'].mode()[0]
-        if n % 2 == 0:
-            founder = 'VAS'
-        else:
-            founder = 'JAKE'
-        sheet_name = founder + ' ' + most_common_company + ' ' + str(n)
-        if n == 0: 
-            writeDataFrameToExcelFile(df, file_path, sheet_name)
-        else: 
-            addDataFrameToExistingExcelFile(df, file_path, sheet_name)
+    # One writer for the whole workbook: every sheet is streamed out in a single pass.
+    # Returns the number of entries written, so callers never re-read the file to count them.
+    entries = countEntries(list_of_dfs)
+    sheet_names = []
+    with METRICS.stage('write', entries):
+        with pd.ExcelWriter(file_path, engine = EXCEL_WRITER_ENGINE, mode = 'w') as writer:
+            for n, df in enumerate(list_of_dfs):
+                # Sheets from splitDataFrame already carry their company label and sender
+                most_common_company = df.attrs['COMPANY'] if 'COMPANY' in df.attrs else df['COMPANY'].mode()[0]
+                founder = df.attrs.get('SENDER') or sheetPartitioner.SENDERS[n % len(sheetPartitioner.SENDERS)]
+                sheet_name = makeSheetName(founder, most_common_company, n)
+                sheet_names.append(sheet_name)
+                df.to_excel(writer, sheet_name = sheet_name, index = False)
+        contactStore.writeStore(list_of_dfs, file_path, sheet_names)
+    METRICS.record_output(file_path, entries, len(list_of_dfs))
     print("Created " + file_path + " with " + str(len(list_of_dfs)) + " sheets.")
+    return entries
 
 def addListOfDataFramesToExistingExcelFile(list_of_dfs, file_path):
-    for n, df in enumerate(list_of_dfs):
-        sheet_name = str(n) + " ADDITION"
-        addDataFrameToExistingExcelFile(df, file_path, sheet_name)
+    if not os.path.exists(file_path):
+        return
+    with pd.ExcelWriter(file_path, engine = 'openpyxl', mode = 'a', if_sheet_exists = 'replace') as writer:
+        for n, df in enumerate(list_of_dfs):
+            sheet_name = str(n) + " ADDITION"
+            df.to_excel(writer, sheet_name = sheet_name, index = False)
     print("Added to " + file_path + " with " + str(len(list_of_dfs)) + " sheets")
 
+def useSuppressionIndex(do_not_email_file):
+    global SUPPRESSION
+    SUPPRESSION = suppressionIndex.getSuppressionIndex(do_not_email_file) if do_not_email_file else None
+    return SUPPRESSION
+
+def isSuppressed(keys, bad_emails):
+    # Which emailCanon keys are in bad_emails or the DO NOT EMAIL index
+    suppressed = bad_emails.containsKeys(keys)
+    if SUPPRESSION is not None:
+        suppressed |= SUPPRESSION.containsKeys(keys)
+    return suppressed
+
 def getGoodAndBadEmailsList(list_of_files, do_not_email_file):
     global GOOD_EMAILS, BAD_EMAILS
-    dne_df = getDataFrameFromExcelFile(do_not_email_file)
-    BAD_EMAILS.update(set(dne_df['EMAIL']))
+    useSuppressionIndex(do_not_email_file)
     for file in list_of_files:
         print(file)
-        list_of_dfs = getListOfDataFramesFromExcelFile(file)
+        list_of_dfs = getListOfDataFramesFromExcelFile(file, ['EMAIL', 'MERGESTATUS'])
         for df in list_of_dfs:
-            df.columns = df.columns.str.replace(' ', '')
-            df.columns = df.columns.str.upper()
-            if 'MERGE' in df.columns:
-                df = df.rename({'MERGE' : 'MERGESTATUS'})
+            df = contactSchema.rename_frame_columns(df)
             if 'MERGESTATUS' in df.columns:
                 keep_emails_df = df[df.MERGESTATUS.isin(MERGE_DROP_LIST) == False]
                 bounced_emails_df = df[df.MERGESTATUS.isin(MERGE_DROP_LIST) == True]
                 keep_emails, bounced_emails = keep_emails_df['EMAIL'], bounced_emails_df['EMAIL']
             else:
                 continue
-            GOOD_EMAILS.update(set(keep_emails))
-            BAD_EMAILS.update(set(bounced_emails))
+            GOOD_EMAILS.update(keep_emails)
+            BAD_EMAILS.update(bounced_emails)
 
 def populateGoodAndBadEmailsList(list_of_files, do_not_email_file):
     getGoodAndBadEmailsList(list_of_files, do_not_email_file)
-    dne_df = pd.DataFrame(list(BAD_EMAILS), columns=['EMAIL'])
-    writeDataFrameToExcelFile(dne_df, do_not_email_file, "DNE")
+    added = suppressionIndex.getSuppressionIndex(do_not_email_file).add(BAD_EMAILS)
+    print(str(added) + " new emails added to " + do_not_email_file + " suppression index.")
 
-def getListOfDataFramesFromExcelFile(file_path):
-    file = pd.ExcelFile(file_path)
-    list_of_sheets = pd.read_excel(file, file.sheet_names)
-    list_of_dfs = list_of_sheets.values()
+def exportDoNotEmailList(do_not_email_file):
+    suppressionIndex.getSuppressionIndex(do_not_email_file).exportToExcel()
+
+def getListOfDataFramesFromExcelFile(file_path, columns = None):
+    with METRICS.stage('read') as stage:
+        list_of_dfs = contactStore.readSheets(file_path, columns)
+        stage.rows_out = countEntries(list_of_dfs)
     return list_of_dfs
 
+def countEntries(list_of_dfs):
+    return sum(len(df) for df in list_of_dfs)
+
 def joinDataFrames(list_of_dfs):
     df = pd.concat(list_of_dfs, ignore_index = True)
     return df
 
-def cleanDataFrame(df):
-    df.columns = df.columns.str.replace(' ', '')
-    df.columns = df.columns.str.upper()
+def cleanSheet(df, bad_emails):
+    # cleanDataFrame for one sheet without touching GOOD_EMAILS/BAD_EMAILS; returns the unsorted sheet and its bounces
+    df = contactSchema.rename_frame_columns(df)
 
-    global GOOD_EMAILS, BAD_EMAILS
-
-    if 'MERGE' in df.columns:
-        df = df.rename({'MERGE' : 'MERGESTATUS'})
+    bounced_emails = emailCanon.EmailSet()
     if 'MERGESTATUS' in df.columns:
-        bounced_emails_df = df[df.MERGESTATUS.isin(MERGE_DROP_LIST) == True]
-        bounced_emails = bounced_emails_df['EMAIL']
-        BAD_EMAILS.update(set(bounced_emails))
-        df = df.copy()
-        df = df[df.MERGESTATUS.isin(MERGE_DROP_LIST) == False]
+        bounced = df.MERGESTATUS.isin(MERGE_DROP_LIST)
+        bounced_emails.update(df.EMAIL[bounced])
+        df = df[bounced == False]
 
-    df = df.copy()
     df = df[df.COMPANY.isin(COMPANY_AVOID_LIST) == False]
 
-    df = df.copy()
-    df.drop_duplicates(subset = 'EMAIL', keep = 'first', inplace = True)
-    df.drop_duplicates(subset = ['COMPANY', 'NAME'], keep = 'first', inplace = True)
+    with METRICS.stage('dedup', len(df)) as stage:
+        keys = emailCanon.emailKeys(df.EMAIL)
+        first = ~emailCanon.duplicatedKeys(keys)
+        df, keys = df[first], keys[first]
+        first = ~df.duplicated(subset = ['COMPANY', 'NAME'], keep = 'first').to_numpy()
+        df, keys = df[first], keys[first]
+        stage.rows_out = len(df)
 
-    mask = df['EMAIL'].apply(validate_email)
-    df = df[mask]
+    mask, reasons = emailValidation.validateEmails(df['EMAIL'])
+    mask = mask.to_numpy()
+    df, keys = df[mask], keys[mask]
 
-    df = df.copy()
-    df = df[df.EMAIL.isin(BAD_EMAILS) == False]
+    df = df[(isSuppressed(keys, bad_emails) | bounced_emails.containsKeys(keys)) == False].copy()
     # df = df[df.EMAIL.isin(GOOD_EMAILS) == False]
 
-    GOOD_EMAILS.update(set(df['EMAIL'])) 
+    return df, bounced_emails
+
+def cleanDataFrame(df):
+    global GOOD_EMAILS, BAD_EMAILS
+
+    df, bounced_emails = cleanSheet(df, BAD_EMAILS)
+    BAD_EMAILS.update(bounced_emails)
+
+    GOOD_EMAILS.update(df['EMAIL'])
     
     df = df.sort_values(by = ['COMPANY'], ascending = True)
     return df
 
-def cleanListOfDataFrames(list_of_dfs):
+def _initCleanWorker(bad_emails, suppression):
+    # suppression is a read-only SuppressionReader: workers must never sync or compact the index files themselves
+    global BAD_EMAILS, SUPPRESSION
+    BAD_EMAILS = bad_emails
+    SUPPRESSION = suppression
+
+def _cleanSheetInWorker(df):
+    return cleanSheet(df, BAD_EMAILS)
+
+def cleanListOfDataFramesParallel(list_of_dfs, workers = None):
+    # Workers only see bounces from before the run, so earlier sheets' bounces are applied here, in sheet order, as serially
+    global GOOD_EMAILS, BAD_EMAILS
+
+    with ProcessPoolExecutor(max_workers = workers, initializer = _initCleanWorker, initargs = (BAD_EMAILS, SUPPRESSION and SUPPRESSION.reader())) as executor:
+        results = list(executor.map(_cleanSheetInWorker, list_of_dfs))
+
     cleaned_dfs = []
-    for df in list_of_dfs:
-        cleaned_dfs.append(cleanDataFrame(df))
+    earlier_bounced_emails = emailCanon.EmailSet()
+    for df, bounced_emails in results:
+        if earlier_bounced_emails:
+            df = df[earlier_bounced_emails.containsEmails(df.EMAIL) == False]
+        earlier_bounced_emails.update(bounced_emails)
+        BAD_EMAILS.update(bounced_emails)
+        GOOD_EMAILS.update(df['EMAIL'])
+        cleaned_dfs.append(df.sort_values(by = ['COMPANY'], ascending = True))
     return cleaned_dfs
 
+def cleanListOfDataFrames(list_of_dfs, workers = 1):
+    # Worker processes keep their own METRICS, so a parallel run reports 'clean' but not 'dedup'
+    with METRICS.stage('clean', countEntries(list_of_dfs)) as stage:
+        if workers != 1:
+            cleaned_dfs = cleanListOfDataFramesParallel(list_of_dfs, workers)
+        else:
+            cleaned_dfs = []
+            for df in list_of_dfs:
+                cleaned_dfs.append(cleanDataFrame(df))
+        stage.rows_out = countEntries(cleaned_dfs)
+    return cleaned_dfs
+
+def iterExcelFileChunks(file_path, chunk_size = STREAM_CHUNK_SIZE, columns = None):
+    # Yields DataFrames of at most chunk_size rows; columns (canonical names) keeps only those cells of each row
+    wanted = None if columns is None else {contactSchema.frame_column_name(column) for column in columns}
+    workbook = load_workbook(file_path, read_only = True)
+    try:
+        for worksheet in workbook.worksheets:
+            rows = worksheet.iter_rows(values_only = True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            header = ['' if h is None else str(h) for h in header]
+            width = len(header)
+            positions = range(width) if wanted is None else [n for n, h in enumerate(header) if contactSchema.frame_column_name(h) in wanted]
+            header = [header[n] for n in positions]
+            chunk = []
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                row = tuple(row[:width]) + (None,) * (width - len(row))
+                chunk.append(row if wanted is None else tuple(row[n] for n in positions))
+                if len(chunk) == chunk_size:
+                    yield pd.DataFrame.from_records(chunk, columns = header)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame.from_records(chunk, columns = header)
+    finally:
+        workbook.close()
+
+def normalizeColumns(df):
+    return contactSchema.rename_frame_columns(df)
+
+def mergeStatusText(statuses):
+    # Excel hands back a MERGESTATUS of 0 as a number; the store keeps it as text, so match it the same way here
+    return statuses.map(lambda v: v if isinstance(v, str) or pd.isna(v) else str(v))
+
+def streamBouncedEmails(file_path, chunk_size = STREAM_CHUNK_SIZE):
+    # Reads only EMAIL and MERGESTATUS, so every bounce in the workbook is known before any row is streamed out
+    global BAD_EMAILS
+    for chunk in iterExcelFileChunks(file_path, chunk_size, ['EMAIL', 'MERGESTATUS']):
+        chunk = normalizeColumns(chunk)
+        if 'MERGESTATUS' in chunk.columns and 'EMAIL' in chunk.columns:
+            BAD_EMAILS.update(chunk.EMAIL[mergeStatusText(chunk.MERGESTATUS).isin(MERGE_DROP_LIST)])
+
+def cleanChunk(df, seen_emails, seen_names):
+    # cleanDataFrame for one chunk; seen_emails (keys) and seen_names ((COMPANY, NAME)) carry dedup across chunks
+    global BAD_EMAILS
+
+    df = normalizeColumns(df)
+    for column in STREAM_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+
+    bounced = mergeStatusText(df.MERGESTATUS).isin(MERGE_DROP_LIST)
+    BAD_EMAILS.update(df.EMAIL[bounced])
+    df = df[~bounced & ~df.COMPANY.isin(COMPANY_AVOID_LIST)]
+
+    with METRICS.stage('dedup', len(df)) as stage:
+        keys = emailCanon.emailKeys(df.EMAIL)
+        seen = np.fromiter((key in seen_emails for key in keys.tolist()), dtype = bool, count = len(keys))
+        first = ~emailCanon.duplicatedKeys(keys) & ~seen
+        df, keys = df[first], keys[first]
+        seen_emails.update(keys[keys != emailCanon.MISSING_KEY].tolist())
+
+        names = pd.Series(list(zip(df.COMPANY, df.NAME)), index = df.index, dtype = object)
+        df = df[~names.duplicated(keep = 'first') & ~names.map(seen_names.__contains__).astype(bool)]
+        seen_names.update(names[df.index])
+        stage.rows_out = len(df)
+
+    mask, reasons = emailValidation.validateEmails(df.EMAIL)
+    df = df[mask]
+    df = df[~isSuppressed(emailCanon.emailKeys(df.EMAIL), BAD_EMAILS)]
+    return df[STREAM_COLUMNS]
+
+def streamCleanExcelFile(contacts_file_path, output_file_path, split_level = 1400, chunk_size = STREAM_CHUNK_SIZE):
+    # Rows keep their source order; memory is bounded by chunk_size plus the dedup sets
+    # Every bounce in the workbook is collected first, so it suppresses the address everywhere
+    with METRICS.stage('suppression'):
+        streamBouncedEmails(contacts_file_path, chunk_size)
+    workbook = Workbook(write_only = True)
+    seen_emails, seen_names = set(), set()
+    worksheet, companies, sheet_rows, n, entries = None, Counter(), 0, 0, 0
+
+    def nameSheet():
+        founder = sheetPartitioner.SENDERS[n % len(sheetPartitioner.SENDERS)]
+        worksheet.title = makeSheetName(founder, companies.most_common(1)[0][0], n)
+
+    for chunk in iterExcelFileChunks(contacts_file_path, chunk_size):
+        with METRICS.stage('clean', len(chunk)) as stage:
+            cleaned = cleanChunk(chunk, seen_emails, seen_names)
+            stage.rows_out = len(cleaned)
+        cleaned = cleaned.astype(object).where(cleaned.notna(), None)
+        for row in cleaned.itertuples(index = False, name = None):
+            if worksheet is None or sheet_rows == split_level:
+                if worksheet is not None:
+                    nameSheet()
+                    n += 1
+                worksheet, companies, sheet_rows = workbook.create_sheet(), Counter(), 0
+                worksheet.append(STREAM_COLUMNS)
+            worksheet.append(row)
+            companies[row[0]] += 1
+            sheet_rows += 1
+            entries += 1
+
+    if worksheet is None:
+        worksheet = workbook.create_sheet()
+        worksheet.append(STREAM_COLUMNS)
+    elif companies:
+        nameSheet()
+    with METRICS.stage('write', entries):
+        workbook.save(output_file_path)
+    METRICS.record_output(output_file_path, entries, n + 1)
+    print("Streamed " + str(entries) + " entries into " + output_file_path + " with " + str(n + 1) + " sheets.")
+    return entries
+
 def splitDataFrame(df, split_level):
-    df = df.sort_values(by = ['COMPANY'], ascending = True)
-    split_dfs = [df.iloc[n:n + split_level, :] for n in range(0, len(df), split_level)]
+    # Whole companies are packed into sheets of at most split_level rows, see sheetPartitioner
+    with METRICS.stage('split', len(df)) as stage:
+        split_dfs = sheetPartitioner.partitionDataFrame(df, split_level)
+        stage.rows_out = countEntries(split_dfs)
     return split_dfs
 
 def keepColumns(df):
@@ -144,62 +353,75 @@ def getOneBigDataFrameFromExcelFile(file_path):
     master_df = joinDataFrames(list_of_dfs)
     return master_df
 
+def printEntries(entries, file_path):
+    print(str(entries) + " entries in " + file_path)
+
 def DEBUG_PLAN(contacts_file_path, base_file_path):
-    populateGoodAndBadEmailsList([contacts_file_path], 'DO NOT EMAIL.xlsx')
+    # Counts come from the data just written, see the 'outputs' of the run report
+    with METRICS.stage('suppression'):
+        populateGoodAndBadEmailsList([contacts_file_path], 'DO NOT EMAIL.xlsx')
 
     list_of_dfs = getListOfDataFramesFromExcelFile(contacts_file_path)
-    writeListOfDataFramesToExcelFile(list_of_dfs, 'STEP1.xlsx')
-    countEntriesInExcelFile('STEP1.xlsx')
+    printEntries(writeListOfDataFramesToExcelFile(list_of_dfs, 'STEP1.xlsx'), 'STEP1.xlsx')
     print("STEP 1 SUCCESS: REPLICATED SOURCING DOCUMENT.\n")
 
     cleaned_list_of_dfs = cleanListOfDataFrames(list_of_dfs)
-    writeListOfDataFramesToExcelFile(cleaned_list_of_dfs, 'STEP2.xlsx')
-    countEntriesInExcelFile('STEP2.xlsx')
+    printEntries(writeListOfDataFramesToExcelFile(cleaned_list_of_dfs, 'STEP2.xlsx'), 'STEP2.xlsx')
     print("STEP 2 SUCCESS: CLEANED SOURCING DOCUMENT.\n")
 
     master_df = joinDataFrames(cleaned_list_of_dfs)
-    writeDataFrameToExcelFile(master_df, 'STEP3.xlsx', 'STEP3')
-    countEntriesInExcelFile('STEP3.xlsx')
+    printEntries(writeDataFrameToExcelFile(master_df, 'STEP3.xlsx', 'STEP3'), 'STEP3.xlsx')
     print("STEP 3 SUCCESS: MERGED CLEANED DOCUMENT INTO MASTER SHEET.\n")
 
     split_master_df = splitDataFrame(master_df, 1400)
-    writeListOfDataFramesToExcelFile(split_master_df, base_file_path)
-    countEntriesInExcelFile(base_file_path)
-    print("STEP 4 SUCCESS: SPLIT CLEANED MASTER INTO SHEETS OF 1400.\n")
+    printEntries(writeListOfDataFramesToExcelFile(split_master_df, base_file_path), base_file_path)
+    print("STEP 4 SUCCESS: SPLIT CLEANED MASTER INTO SHEETS OF UP TO 1400, KEEPING COMPANIES TOGETHER.\n")
+    METRICS.write_report()
 
-def createNewBase(contacts_file_path, base_file_path):
-    populateGoodAndBadEmailsList([contacts_file_path], 'DO NOT EMAIL.xlsx')
+def createNewBase(contacts_file_path, base_file_path, workers = 1):
+    with METRICS.stage('suppression'):
+        populateGoodAndBadEmailsList([contacts_file_path], 'DO NOT EMAIL.xlsx')
 
     list_of_dfs = getListOfDataFramesFromExcelFile(contacts_file_path)
 
-    cleaned_list_of_dfs = cleanListOfDataFrames(list_of_dfs)
+    cleaned_list_of_dfs = cleanListOfDataFrames(list_of_dfs, workers)
 
     master_df = joinDataFrames(cleaned_list_of_dfs)
 
     split_master_df = splitDataFrame(master_df, 1400)
     writeListOfDataFramesToExcelFile(split_master_df, base_file_path)
+    METRICS.write_report()
+
+def createNewBaseStreaming(contacts_file_path, base_file_path, chunk_size = STREAM_CHUNK_SIZE):
+    suppression = useSuppressionIndex('DO NOT EMAIL.xlsx')
+    with METRICS.stage('stream'):
+        streamCleanExcelFile(contacts_file_path, base_file_path, 1400, chunk_size)
+    with METRICS.stage('suppression'):
+        suppression.add(BAD_EMAILS)
+    METRICS.write_report()
 
 def countNumberOfSheetsInExcelFile(file_path):
-    file = pd.ExcelFile(file_path)
-    return len(file.sheet_names)
+    return len(contactStore.getSheetNames(file_path))
 
 def countEntriesInExcelFile(file_path):
-    master_df = getOneBigDataFrameFromExcelFile(file_path)
-    print(str(len(master_df)) + " entries in " + file_path)
-    # return len(master_df)
+    entries = contactStore.countRows(file_path)
+    print(str(entries) + " entries in " + file_path)
+    # return entries
 
 def countEntriesAndSheetsInExcelFile(file_path):
-    master_df = getOneBigDataFrameFromExcelFile(file_path)
-    print(str(len(master_df)) + " entries and " + str(countNumberOfSheetsInExcelFile(file_path)) + " sheets in " + file_path)
-    return len(master_df)
+    entries = contactStore.countRows(file_path)
+    print(str(entries) + " entries and " + str(countNumberOfSheetsInExcelFile(file_path)) + " sheets in " + file_path)
+    return entries
 
-def addToBase(base_file_path, to_add_file_path):
-    populateGoodAndBadEmailsList([base_file_path], 'DO NOT EMAIL.xlsx')
+def addToBase(base_file_path, to_add_file_path, workers = 1):
+    with METRICS.stage('suppression'):
+        populateGoodAndBadEmailsList([base_file_path], 'DO NOT EMAIL.xlsx')
     list_of_dfs = getListOfDataFramesFromExcelFile(to_add_file_path)
-    cleaned_list_of_dfs = cleanListOfDataFrames(list_of_dfs)
+    cleaned_list_of_dfs = cleanListOfDataFrames(list_of_dfs, workers)
     master_df = joinDataFrames(cleaned_list_of_dfs)
     split_master_df = splitDataFrame(master_df, 1400)
     writeListOfDataFramesToExcelFile(split_master_df, "2023 Email List With Append.xlsx")
+    METRICS.write_report()
 
 def filterColumns(df):
     columns_to_keep = ['COMPANY', 'NAME', 'FIRST', 'EMAIL']
@@ -207,25 +429,21 @@ def filterColumns(df):
     return filtered_df
 
 def validate_email(email):
-    email_regex = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
+    return emailValidation.isValidEmail(email)
 
-    if re.match(email_regex, email):
-        return True
-    else:
-        return False
+# The checks below each compute all three partitions; call compareEmailLists
+# (or listComparison.compareWorkbooks) once when more than one is needed.
+def compareEmailLists(left_df, right_df):
+    return listComparison.compareFrames(left_df, right_df)
 
 def checkInBoth(left_df, right_df):
-    result = pd.merge(left_df, right_df, on = 'EMAIL', how = 'outer', indicator = True)
-    result2 = result.loc[result['_merge'] == 'both', ['EMAIL']]
-    return result2
+    return compareEmailLists(left_df, right_df).both
 
 def checkOnlyInLeft(left_df, right_df):
-    result = pd.merge(left_df, right_df, on = 'EMAIL', how = 'outer', indicator = True)
-    result2 = result.loc[result['_merge'] == 'left_only', ['EMAIL']]
-    return result2
+    return compareEmailLists(left_df, right_df).left_only
 
 def checkOnlyInRight(left_df, right_df):
-    return checkOnlyInLeft(right_df, left_df)
+    return compareEmailLists(left_df, right_df).right_only
 
 def updateBouncesPostSend(file_path):
     return 0
@@ -240,14 +458,18 @@ def emailsThatBouncedFromDataFrame(df):
     return 0
 
 def generateFollowUpSheet(file_path):
-    populateGoodAndBadEmailsList([file_path], 'DO NOT EMAIL.xlsx')
+    with METRICS.stage('suppression'):
+        populateGoodAndBadEmailsList([file_path], 'DO NOT EMAIL.xlsx')
     list_of_dfs = getListOfDataFramesFromExcelFile(file_path)
     cleaned_list_of_dfs = cleanListOfDataFrames(list_of_dfs)
     master_df = joinDataFrames(cleaned_list_of_dfs)
     filtered_df = filterColumns(master_df)
     split_up_df = splitDataFrame(filtered_df, 1490)
-    writeListOfDataFramesToExcelFile(split_up_df, '2023 Email List FOLLOWUP.xlsx')
-    print(countEntriesAndSheetsInExcelFile('2023 Email List FOLLOWUP.xlsx'))
-
-# generateFollowUpSheet('2023 Email List.xlsx')
-countEntriesAndSheetsInExcelFile('DO NOT EMAIL.xlsx')
\ No newline at end of file
+    entries = writeListOfDataFramesToExcelFile(split_up_df, '2023 Email List FOLLOWUP.xlsx')
+    print(str(entries) + " entries and " + str(len(split_up_df)) + " sheets in 2023 Email List FOLLOWUP.xlsx")
+    METRICS.write_report()
+
+# Guarded so process pool workers can import this module without re-running it.
+if __name__ == '__main__':
+    # generateFollowUpSheet('2023 Email List.xlsx')
+    countEntriesAndSheetsInExcelFile('DO NOT EMAIL.xlsx')
\ No newline at end of file
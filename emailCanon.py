@@ -0,0 +1,137 @@
+import sys
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Canonical email addresses and their 64-bit keys, shared by every dedup and
+# suppression check. The canonical form is trimmed and lower-cased; with
+# GMAIL_RULES on, gmail.com/googlemail.com addresses also lose the dots and any
+# +tag in their local part. Keys are the first 8 bytes of the canonical
+# string's BLAKE2b digest, read little-endian, which depends on nothing but the
+# string, so an address gets the same key in every run, script and library
+# version. Keys persisted to disk are only valid for the KEY_SCHEME and gmail
+# rules they were made with, see keyScheme. MISSING_KEY stands for cells with no email.
+
+GMAIL_RULES = False
+GMAIL_DOMAINS = ('gmail.com', 'googlemail.com')
+MISSING_KEY = 0
+KEY_SCHEME = 'blake2b-64le'
+KEY_CHUNK_SIZE = 65536  # emailKeys canonicalizes this many emails at a time to bound temporary strings
+
+def _gmailRules(gmail_rules):
+    return GMAIL_RULES if gmail_rules is None else gmail_rules
+
+def keyScheme(gmail_rules = None):
+    """What keys depend on besides the email itself; stored next to persisted keys so stale ones are rebuilt."""
+    return {'scheme': KEY_SCHEME, 'gmail_rules': bool(_gmailRules(gmail_rules))}
+
+def canonicalEmail(email, gmail_rules = None):
+    if not isinstance(email, str):
+        return None
+    email = email.strip().lower()
+    if not email:
+        return None
+    if _gmailRules(gmail_rules):
+        local, at, domain = email.rpartition('@')
+        if at and domain in GMAIL_DOMAINS:
+            email = local.split('+', 1)[0].replace('.', '') + '@gmail.com'
+    return sys.intern(email)
+
+def canonicalEmails(emails, gmail_rules = None):
+    """canonicalEmail for a Series (or any sequence); anything that is not a non-empty string becomes NaN."""
+    values = emails.astype(object) if isinstance(emails, pd.Series) else pd.Series(list(emails), dtype = object)
+    values = values.where(values.map(lambda v: isinstance(v, str))).str.strip().str.lower()
+    values = values.where(values != '')
+    if _gmailRules(gmail_rules):
+        parts = values.str.rpartition('@')
+        gmail = parts[2].isin(GMAIL_DOMAINS) & (parts[1] == '@')
+        local = parts[0][gmail].str.split('+', n = 1).str[0].str.replace('.', '', regex = False)
+        values[gmail] = local + '@gmail.com'
+    return values
+
+def keysForCanonical(values):
+    """uint64 keys for already-canonical emails (a Series or sequence, None/NaN for missing)."""
+    values = pd.Series(values, dtype = object) if not isinstance(values, pd.Series) else values.astype(object)
+    missing = values.isna().to_numpy()
+    digests = b''.join(hashlib.blake2b(value.encode('utf-8'), digest_size = 8).digest() for value in values.where(~missing, '').tolist())
+    keys = np.frombuffer(digests, dtype = '<u8').astype(np.uint64)
+    keys[missing] = MISSING_KEY
+    return keys
+
+def emailKeys(emails, gmail_rules = None):
+    """uint64 key per email of a Series or sequence, MISSING_KEY where there is none."""
+    if len(emails) <= KEY_CHUNK_SIZE:
+        return keysForCanonical(canonicalEmails(emails, gmail_rules))
+    return np.concatenate([keysForCanonical(canonicalEmails(emails[start:start + KEY_CHUNK_SIZE], gmail_rules))
+                           for start in range(0, len(emails), KEY_CHUNK_SIZE)])
+
+def emailKey(email, gmail_rules = None):
+    return int(emailKeys(pd.Series([email], dtype = object), gmail_rules)[0])
+
+def duplicatedKeys(keys):
+    """Boolean mask marking every repeat of an earlier key, like Series.duplicated(keep = 'first')."""
+    return pd.Index(keys).duplicated(keep = 'first')
+
+class EmailSet:
+    """Set of canonical emails held as {key: email}, so lookups and dedup compare integers.
+
+    Iterating yields the canonical emails. containsKeys answers membership for a
+    whole array of keys at once against a sorted key array, rebuilt only after
+    the set has changed.
+    """
+
+    __slots__ = ('emails', 'gmail_rules', '_sorted_keys')
+
+    def __init__(self, emails = (), gmail_rules = None):
+        self.emails = {}
+        self.gmail_rules = _gmailRules(gmail_rules)
+        self._sorted_keys = None
+        self.update(emails)
+
+    def update(self, emails):
+        """Add emails (any iterable, Series or EmailSet). Returns the canonical emails that were new."""
+        if isinstance(emails, EmailSet) and emails.gmail_rules == self.gmail_rules:
+            items = emails.emails.items()
+        else:
+            values = canonicalEmails(emails, self.gmail_rules).dropna()
+            items = zip(keysForCanonical(values).tolist(), values.tolist())
+        new_emails = {}
+        for key, email in items:
+            if key not in self.emails and key not in new_emails:
+                new_emails[key] = sys.intern(email)
+        if new_emails:
+            self.emails.update(new_emails)
+            self._sorted_keys = None
+        return list(new_emails.values())
+
+    def add(self, email):
+        return self.update([email])
+
+    def __contains__(self, email):
+        return emailKey(email, self.gmail_rules) in self.emails
+
+    def containsKeys(self, keys):
+        """Boolean array: which of keys (from emailKeys with the same gmail rules) are in the set."""
+        keys = np.asarray(keys, dtype = np.uint64)
+        if not self.emails or not len(keys):
+            return np.zeros(len(keys), dtype = bool)
+        if self._sorted_keys is None and len(keys) * 8 < len(self.emails):
+            # Few lookups against a big set that just changed: cheaper than re-sorting it
+            return np.fromiter((key in self.emails for key in keys.tolist()), dtype = bool, count = len(keys))
+        if self._sorted_keys is None:
+            self._sorted_keys = np.sort(np.fromiter(self.emails.keys(), dtype = np.uint64, count = len(self.emails)))
+        positions = np.searchsorted(self._sorted_keys, keys).clip(max = len(self._sorted_keys) - 1)
+        return self._sorted_keys[positions] == keys
+
+    def containsEmails(self, emails):
+        """containsKeys for a Series or sequence of raw emails."""
+        return self.containsKeys(emailKeys(emails, self.gmail_rules))
+
+    def __len__(self):
+        return len(self.emails)
+
+    def __iter__(self):
+        return iter(self.emails.values())
+
+    def __bool__(self):
+        return bool(self.emails)
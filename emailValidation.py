@@ -0,0 +1,58 @@
+import re
+import importlib.util
+import numpy as np
+import pandas as pd
+
+# One email validation engine for dataCleaning and crm_v1. Everything runs
+# through pandas' vectorized string methods; each row gets a reason code.
+# Emails are validated with surrounding whitespace trimmed, the way emailCanon
+# trims them for dedup and suppression, so a padded spelling of an address is
+# exactly as valid as the address itself.
+
+EMAIL_PATTERN = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
+EMAIL_REGEX = re.compile(EMAIL_PATTERN)
+# Same shape as EMAIL_PATTERN but accepts any final label, so a bad TLD can be told apart from bad syntax.
+SYNTAX_PATTERN = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[^.@\s]+"
+
+ROLE_ACCOUNTS = ['admin', 'administrator', 'billing', 'contact', 'enquiries', 'feedback', 'hello', 'help',
+                 'hr', 'info', 'inquiries', 'jobs', 'marketing', 'no-reply', 'noreply', 'office', 'press',
+                 'sales', 'support', 'team', 'webmaster']
+ROLE_PATTERN = r"(?:" + "|".join(re.escape(account) for account in ROLE_ACCOUNTS) + r")@.*"
+
+VALID = 'VALID'
+SYNTAX = 'SYNTAX'
+BAD_TLD = 'BAD_TLD'
+ROLE_ADDRESS = 'ROLE_ADDRESS'
+DUPLICATE = 'DUPLICATE'
+
+STRING_DTYPE = 'string[pyarrow]' if importlib.util.find_spec('pyarrow') else 'string'
+
+def isValidEmail(email):
+    return isinstance(email, str) and EMAIL_REGEX.fullmatch(email.strip()) is not None
+
+def validateEmails(emails, allow_role_addresses = True, allow_duplicates = True):
+    """Validate a Series of emails.
+
+    Returns (mask, reasons): mask is True for rows to keep, reasons holds one of
+    VALID, SYNTAX, BAD_TLD, ROLE_ADDRESS or DUPLICATE per row. Missing and
+    non-string values count as SYNTAX, and surrounding whitespace is ignored.
+    Role addresses and repeats (compared case-insensitively) are always
+    reported but only rejected when not allowed.
+    """
+    # Numbers and other stray cell values become strings that can never match.
+    values = emails.astype(STRING_DTYPE).str.strip()
+
+    syntax_ok = values.str.fullmatch(SYNTAX_PATTERN).fillna(False).to_numpy(dtype = bool)
+    tld_ok = values.str.fullmatch(EMAIL_PATTERN).fillna(False).to_numpy(dtype = bool)
+    lowered = values.str.lower()
+    role = lowered.str.fullmatch(ROLE_PATTERN).fillna(False).to_numpy(dtype = bool)
+    duplicate = lowered.duplicated(keep = 'first').to_numpy() & tld_ok
+
+    reasons = pd.Series(np.select([~syntax_ok, ~tld_ok, role, duplicate], [SYNTAX, BAD_TLD, ROLE_ADDRESS, DUPLICATE], VALID),
+                        index = emails.index)
+    mask = tld_ok.copy()
+    if not allow_role_addresses:
+        mask &= ~role
+    if not allow_duplicates:
+        mask &= ~duplicate
+    return pd.Series(mask, index = emails.index), reasons
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import random
+import time
+from llmCache import cache_key
+from pipelineMetrics import METRICS
+
+# Async engine for the gptCalls enrichment prompts: bounded concurrency,
+# request/token-per-minute limits, jittered retries on 429/5xx, and results
+# returned in the order the prompts were given. The completion call is
+# pluggable, and api_base can point the OpenAI client at a local stub server.
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+def normalize_input(item):
+    # Collapse whitespace and case so 'Acme  Inc' and 'ACME INC' share one call.
+    return tuple(' '.join(str(value).split()).casefold() for value in item)
+
+def estimate_tokens(messages):
+    # Roughly four characters per token, plus headroom for the reply.
+    return sum(len(message['content']) for message in messages) // 4 + 256
+
+def parse_json_array(response, expected_length):
+    text = response.strip()
+    if text.startswith('```'):
+        # Models like to wrap JSON in a fenced code block
+        text = text.strip('`')
+        text = text[text.index('\n') + 1:] if '\n' in text else text
+    values = json.loads(text)
+    if not isinstance(values, list) or len(values) != expected_length:
+        raise ValueError(f"expected a JSON array of {expected_length} items, got {response[:200]!r}")
+    return values
+
+def get_status(error):
+    return getattr(error, 'http_status', None) or getattr(error, 'status_code', None) or getattr(error, 'status', None)
+
+def is_retryable(error):
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in ('RateLimitError', 'ServiceUnavailableError', 'Timeout', 'APIConnectionError', 'TryAgain'):
+        return True
+    return get_status(error) in RETRYABLE_STATUS
+
+def get_retry_after(error):
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """Token bucket that refills `per_minute` units evenly over each minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount = 1):
+        if not self.capacity:
+            return
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) * 60 / self.capacity)
+
+async def openai_chat_completion(model, messages, api_base = None):
+    import openai
+    kwargs = {'api_base': api_base} if api_base else {}
+    response = await openai.ChatCompletion.acreate(model = model, messages = messages, **kwargs)
+    return response.choices[0].message['content'].strip()
+
+class EnrichmentEngine:
+    def __init__(self, concurrency = 8, requests_per_minute = 3000, tokens_per_minute = 90000,
+                 max_retries = 6, base_delay = 1.0, max_delay = 60.0, complete = None, api_base = None, cache = None):
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.loop = None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.complete_fn = complete or openai_chat_completion
+        self.api_base = api_base
+        self.cache = cache
+        self.inflight = {}
+        self.coalesced = 0
+        self.rows = 0
+        self.unique_inputs = 0
+        self.split_batches = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def bind(self):
+        # asyncio primitives belong to one event loop; rebuild them when run() starts a new one.
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.requests = RateLimiter(self.requests_per_minute)
+            self.tokens = RateLimiter(self.tokens_per_minute)
+
+    def backoff(self, attempt, error):
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        # Full jitter so a burst of 429s does not retry in lockstep.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _call(self, model, messages):
+        if self.api_base:
+            return await self.complete_fn(model, messages, api_base = self.api_base)
+        return await self.complete_fn(model, messages)
+
+    async def complete(self, model, messages):
+        """Complete one prompt; identical prompts already in flight share the same pending task."""
+        self.bind()
+        key = cache_key(model, messages)
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            METRICS.count('openai.coalesced')
+        else:
+            task = asyncio.ensure_future(self._complete_cached(model, messages))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _complete_cached(self, model, messages):
+        if self.cache is not None:
+            response = self.cache.get(model, messages)
+            if response is not None:
+                return response
+        response = await self._complete_with_retries(model, messages)
+        if self.cache is not None:
+            self.cache.set(model, messages, response)
+        return response
+
+    async def _complete_with_retries(self, model, messages):
+        for attempt in range(self.max_retries + 1):
+            await self.requests.acquire()
+            await self.tokens.acquire(estimate_tokens(messages))
+            try:
+                async with self.semaphore:
+                    self.calls += 1
+                    with METRICS.api_call('openai.' + model):
+                        return await self._call(model, messages)
+            except Exception as error:
+                if attempt == self.max_retries or not is_retryable(error):
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                METRICS.retry('openai.' + model)
+                await asyncio.sleep(self.backoff(attempt, error))
+
+    async def map(self, model, list_of_messages, return_exceptions = True):
+        """Complete every prompt; results (or exceptions) come back in input order."""
+        self.bind()
+        return await asyncio.gather(*(self.complete(model, messages) for messages in list_of_messages),
+                                    return_exceptions = return_exceptions)
+
+    def run(self, model, list_of_messages, return_exceptions = True):
+        return asyncio.run(self.map(model, list_of_messages, return_exceptions))
+
+    async def complete_batch(self, model, items, build_batch_messages, validate, build_single_messages = None):
+        """One request for a whole batch of inputs, expecting a JSON array back.
+
+        A reply of the wrong length or with an invalid item (a ValueError from
+        parsing or validate) is evicted from the cache and the batch is split in
+        half and retried, down to single items, which use build_single_messages
+        when given. A failed request, which has already used up its retries, is
+        not retried again: its error comes back in every slot of the batch, as do
+        items that still fail.
+        """
+        messages = build_batch_messages(items)
+        try:
+            response = await self.complete(model, messages)
+        except Exception as error:
+            return [error] * len(items)
+        try:
+            return [validate(value) for value in parse_json_array(response, len(items))]
+        except ValueError as error:
+            if self.cache is not None:
+                self.cache.delete(model, messages)
+            if len(items) > 1:
+                self.split_batches += 1
+                middle = len(items) // 2
+                left, right = await asyncio.gather(
+                    self.complete_batch(model, items[:middle], build_batch_messages, validate, build_single_messages),
+                    self.complete_batch(model, items[middle:], build_batch_messages, validate, build_single_messages))
+                return left + right
+            if build_single_messages is None:
+                return [error]
+        single_messages = build_single_messages(*items[0])
+        try:
+            response = await self.complete(model, single_messages)
+        except Exception as error:
+            return [error]
+        try:
+            return [validate(response)]
+        except ValueError as error:
+            if self.cache is not None:
+                self.cache.delete(model, single_messages)
+            return [error]
+
+    def run_batched(self, model, inputs, build_batch_messages, validate, batch_size = 25, build_single_messages = None,
+                    normalize = normalize_input):
+        """run_unique, but packing up to batch_size distinct inputs into each request."""
+        keys = [normalize(item) for item in inputs]
+        unique = {}
+        for key, item in zip(keys, inputs):
+            unique.setdefault(key, item)
+        self.rows += len(inputs)
+        self.unique_inputs += len(unique)
+
+        items = list(unique.values())
+        batches = [items[n:n + batch_size] for n in range(0, len(items), batch_size)]
+
+        async def run_batches():
+            self.bind()
+            return await asyncio.gather(*(self.complete_batch(model, batch, build_batch_messages, validate, build_single_messages)
+                                          for batch in batches))
+
+        results = [result for batch_results in asyncio.run(run_batches()) for result in batch_results]
+        by_key = dict(zip(unique, results))
+        return [by_key[key] for key in keys]
+
+    def run_unique(self, model, inputs, build_messages, normalize = normalize_input, return_exceptions = True):
+        """Call the model once per distinct normalized input and fan the answers back out.
+
+        inputs is a list of argument tuples for build_messages; the first row seen
+        for each normalized key is the one sent to the model.
+        """
+        keys = [normalize(item) for item in inputs]
+        unique = {}
+        for key, item in zip(keys, inputs):
+            unique.setdefault(key, item)
+        self.rows += len(inputs)
+        self.unique_inputs += len(unique)
+        results = self.run(model, [build_messages(*item) for item in unique.values()], return_exceptions)
+        by_key = dict(zip(unique, results))
+        return [by_key[key] for key in keys]
+
+    def summary(self):
+        summary = f"{self.calls} API calls, {self.retries} retries, {self.failures} failures"
+        if self.rows:
+            summary += f", {self.rows} rows -> {self.unique_inputs} unique inputs"
+        if self.split_batches:
+            summary += f", {self.split_batches} batches split and retried"
+        if self.coalesced:
+            summary += f", {self.coalesced} duplicate requests coalesced"
+        if self.cache is not None:
+            summary += ", " + self.cache.summary()
+        return summary
@@ -1,51 +1,73 @@
 import os
-import pickle
+import functools
 import base64
 import pandas as pd
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import mimetypes
 import re
+import googleClients
+from pipelineMetrics import METRICS
+from sendQueue import SendQueue, BulkSender
+from templateEngine import Template
+
+
+CLIENT_SECRET_FILE = googleClients.CLIENT_SECRET_FILE
+SCOPES = googleClients.GMAIL_SCOPES
+SEND_QUEUE_FILE = 'send_queue.sqlite'
+SEND_WORKERS = 4
+# Gmail caps batch requests at 100 calls and recommends no more than 50
+GMAIL_BATCH_SIZE = 50
+SEND_BATCH_SIZE = 10
+# Values every recipient has; a template may also use any column of the recipients' sheet
+RECIPIENT_FIELDS = ('FIRST', 'NAME', 'COMPANY')
+# Set to 'emailTemplate.html' to send that body (with the draft's subject) instead of the draft's own body
+TEMPLATE_FILE = None
 
+def get_credentials():
+    # Loaded, refreshed if expired, and cached for the process by googleClients
+    return googleClients.get_credentials(SCOPES, client_secret_file=CLIENT_SECRET_FILE)
 
-CLIENT_SECRET_FILE = 'client_secret_file.json'
-SCOPES = ['https://www.googleapis.com/auth/gmail.send', 'https://www.googleapis.com/auth/gmail.compose', 'https://www.googleapis.com/auth/gmail.modify']
 
-def get_credentials():
-    token_file = 'token.pickle'
-    
-    if os.path.exists(token_file):
-        with open(token_file, 'rb') as token:
-            credentials = pickle.load(token)
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
-        credentials = flow.run_local_server(port=8080)
-        
-        with open(token_file, 'wb') as token:
-            pickle.dump(credentials, token)
-            
-    return credentials
+def get_gmail_service():
+    # One shared service per process; BulkSender workers use get_thread_gmail_service instead
+    return googleClients.get_service('gmail', 'v1', SCOPES)
 
 
-def get_gmail_service(credentials):
-    return build('gmail', 'v1', credentials=credentials)
+def get_thread_gmail_service():
+    return googleClients.thread_service('gmail', 'v1', SCOPES)
+
+
+def fetch_draft_subjects(service, drafts, batch_size=GMAIL_BATCH_SIZE):
+    """Subject of every draft, fetched as metadata through batch requests instead of one get per draft."""
+    subjects = {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            print(f"Could not load draft {request_id}: {exception}")
+            subjects[request_id] = "(No subject)"
+        else:
+            subjects[request_id] = next((header['value'] for header in response['message']['payload'].get('headers', []) if header['name'].lower() == 'subject'), "(No subject)")
+
+    for start in range(0, len(drafts), batch_size):
+        batch = service.new_batch_http_request(callback=callback)
+        for draft in drafts[start:start + batch_size]:
+            batch.add(service.users().drafts().get(userId='me', id=draft['id'], format='metadata', metadataHeaders=['Subject']), request_id=draft['id'])
+        METRICS.execute('gmail.batch', batch)
+
+    return [subjects[draft['id']] for draft in drafts]
 
 
 def choose_draft(service):
-    drafts = service.users().drafts().list(userId='me').execute()
+    drafts = METRICS.execute('gmail.drafts.list', service.users().drafts().list(userId='me'))
 
-    if not drafts['drafts']:
+    if not drafts.get('drafts'):
         print('No drafts found.')
         return None
 
-    for index, draft in enumerate(drafts['drafts'], start=1):
-        draft_details = service.users().drafts().get(userId='me', id=draft['id']).execute()
-        draft_subject = next((header['value'] for header in draft_details['message']['payload']['headers'] if header['name'].lower() == 'subject'), "(No subject)")
+    for index, draft_subject in enumerate(fetch_draft_subjects(service, drafts['drafts']), start=1):
         print(f"{index}: {draft_subject}")
 
     while True:
@@ -65,7 +87,7 @@ def choose_draft(service):
 
 
 def get_draft_details(service, draft_id):
-    return service.users().drafts().get(userId='me', id=draft_id).execute()
+    return METRICS.execute('gmail.drafts.get', service.users().drafts().get(userId='me', id=draft_id))
 
 
 def get_draft_subject(payload):
@@ -103,7 +125,8 @@ def find_draft_body(parts):
 
 
 def update_body_content(body, name, company):
-    content = body.get_payload().replace('{{FIRST}}', name.split()[0]).replace('{{COMPANY}}', company)
+    template = Template(body.get_payload(), escape=body.get_content_subtype() == 'html')
+    content = template.render({'FIRST': name.split()[0], 'COMPANY': company}, strict=False)
     charset = body.get_content_charset()
     subtype = body.get_content_subtype()
 
@@ -115,7 +138,25 @@ def update_body_content(body, name, company):
     return new_body
 
 
-def send_email(service, to_email, subject, body, attachment_path=None):
+@functools.lru_cache(maxsize=None)
+def load_attachment_part(attachment_path):
+    """Read and base64-encode an attachment once; the same part is reused for every message."""
+    content_type, encoding = mimetypes.guess_type(attachment_path)
+
+    if content_type is None or encoding is not None:
+        content_type = 'application/octet-stream'
+
+    main_type, sub_type = content_type.split('/', 1)
+    with open(attachment_path, 'rb') as file:
+        attachment = MIMEBase(main_type, sub_type)
+        attachment.set_payload(file.read())
+
+    encoders.encode_base64(attachment)
+    attachment.add_header('Content-Disposition', 'attachment', filename=os.path.basename(attachment_path))
+    return attachment
+
+
+def create_message(to_email, subject, body, attachment_path=None):
     message = MIMEMultipart("related")
     message['to'] = to_email
     message['subject'] = subject
@@ -123,23 +164,74 @@ def send_email(service, to_email, subject, body, attachment_path=None):
     message.attach(body)
 
     if attachment_path:
-        content_type, encoding = mimetypes.guess_type(attachment_path)
-
-        if content_type is None or encoding is not None:
-            content_type = 'application/octet-stream'
+        message.attach(load_attachment_part(attachment_path))
 
-        main_type, sub_type = content_type.split('/', 1)
-        with open(attachment_path, 'rb') as file:
-            attachment = MIMEBase(main_type, sub_type)
-            attachment.set_payload(file.read())
+    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+    return {'raw': raw_message}
+
+
+class MessageTemplate:
+    """A draft compiled once for mass sending.
+
+    The subject and body are parsed once by templateEngine and the attachment is
+    encoded once, so each recipient only costs a few string joins and one
+    serialization of the final message. HTML bodies get their values escaped.
+    Fields the template uses but no recipient value or default covers raise a
+    KeyError here, before anything is queued, rather than rendering empty.
+    """
+
+    def __init__(self, subject, body, subtype='html', attachment_path=None, fields=RECIPIENT_FIELDS):
+        self.subtype = subtype
+        self.subject = Template(subject, escape=False)
+        self.body = body
+        self.attachment = load_attachment_part(attachment_path) if attachment_path else None
+        self.bodies = {}
+
+        missing = list(dict.fromkeys(self.subject.missing_fields(fields) + self.body.missing_fields(fields)))
+        if missing:
+            raise KeyError(f"template fields with no value: {', '.join(missing)}")
+
+    @classmethod
+    def from_draft(cls, subject, body, attachment_path=None, fields=RECIPIENT_FIELDS):
+        charset = body.get_content_charset() or 'utf-8'
+        subtype = body.get_content_subtype()
+        return cls(subject, Template(body.get_payload(decode=True).decode(charset), escape=subtype == 'html'), subtype, attachment_path, fields)
+
+    @classmethod
+    def from_file(cls, subject, path, attachment_path=None, fields=RECIPIENT_FIELDS):
+        """An HTML template such as emailTemplate.html, sent instead of the draft's body."""
+        return cls(subject, Template.from_file(path), 'html', attachment_path, fields)
+
+    def prerender(self, df):
+        """Render every recipient's body column-wise in one pass; render() then reuses them by EMAIL.
+
+        Like SendQueue.enqueue, the first row for a repeated EMAIL wins.
+        """
+        df = df.drop_duplicates('EMAIL')
+        self.bodies = dict(zip(df['EMAIL'], self.body.render_frame(df)))
+
+    def render(self, to_email, name, company):
+        names = str(name).split() if isinstance(name, str) else []
+        values = {'FIRST': names[0] if names else None, 'NAME': name, 'COMPANY': company}
+        # Fields were checked in __init__; recipients queued by an earlier run may not have been prerendered
+        body = self.bodies.get(to_email)
+        if body is None:
+            body = self.body.render(values, strict=False)
+
+        message = MIMEMultipart("related")
+        message['to'] = to_email
+        message['subject'] = self.subject.render(values, strict=False)
+        # Always utf-8: the draft's own charset is us-ascii when it is plain ASCII, which names like 'José' don't fit
+        message.attach(MIMEText(body, _subtype=self.subtype, _charset='utf-8'))
+        if self.attachment is not None:
+            message.attach(self.attachment)
+
+        return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')}
 
-        encoders.encode_base64(attachment)
-        attachment.add_header('Content-Disposition', 'attachment', filename=os.path.basename(attachment_path))
-        message.attach(attachment)
 
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-    send_message = {'raw': raw_message}
-    send_message = service.users().messages().send(userId="me", body=send_message).execute()
+def send_email(service, to_email, subject, body, attachment_path=None):
+    send_message = create_message(to_email, subject, body, attachment_path)
+    send_message = METRICS.execute('gmail.messages.send', service.users().messages().send(userId="me", body=send_message))
 
     print(F'sent message to {to_email} Message Id: {send_message["id"]}')
     return send_message
@@ -153,8 +245,7 @@ def main():
     }
 
     df = pd.DataFrame(data)
-    credentials = get_credentials()
-    service = get_gmail_service(credentials)
+    service = get_gmail_service()
 
     selected_draft = choose_draft(service)
 
@@ -181,16 +272,37 @@ def main():
 
         attachment_path = os.path.join(os.getcwd(), 'JV Consulting Deck.pdf')
 
-        for _, row in df.iterrows():
-            name, company, email = row['NAME'], row['COMPANY'], row['EMAIL']
-            email_subject = draft_subject.replace('{{COMPANY}}', company)
+        if not draft_body and not TEMPLATE_FILE:
+            print("Error: Draft body is empty. No email was sent.")
+            return
 
-            if draft_body:
-                updated_body = update_body_content(draft_body, name, company)
-                send_email(service, email, email_subject, updated_body, attachment_path)
+        fields = set(RECIPIENT_FIELDS) | set(df.columns)
+        try:
+            if TEMPLATE_FILE:
+                template = MessageTemplate.from_file(draft_subject, TEMPLATE_FILE, attachment_path, fields)
             else:
-                print(f"Error: Draft body is empty. Skipping email for {name}.")
-
+                template = MessageTemplate.from_draft(draft_subject, draft_body, attachment_path, fields)
+        except KeyError as error:
+            print(f"Error: {error.args[0]}. No email was sent.")
+            return
+        template.prerender(df)
+
+        # The draft id names the campaign, so re-running with the same draft resumes it
+        campaign = selected_draft['id']
+        queue = SendQueue(SEND_QUEUE_FILE)
+        interrupted = queue.recover(campaign)
+        if interrupted:
+            print(f"{interrupted} sends were interrupted by a previous crash and are marked FAILED; check them before retrying.")
+        queued = queue.enqueue(campaign, zip(df['EMAIL'], df['NAME'], df['COMPANY']))
+        print(f"Queued {queued} new recipients for this draft.")
+
+        sender = BulkSender(queue, get_thread_gmail_service, template.render, workers=SEND_WORKERS, batch_size=SEND_BATCH_SIZE)
+        counts = sender.run(campaign)
+        print("Send queue status:", counts)
+        for status, count in counts.items():
+            METRICS.count('send_queue.' + status, count)
+        queue.close()
+        METRICS.write_report()
 
 if __name__ == '__main__':
     main()
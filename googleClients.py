@@ -0,0 +1,81 @@
+import os
+import pickle
+import threading
+
+# Shared factory for the Google API clients used by consolidateEmails, gptCalls
+# and gmailCalls. Nothing happens at import time: credentials are loaded (and
+# refreshed or re-authorized) the first time a service is asked for, services
+# are built from the discovery documents bundled with google-api-python-client
+# instead of fetching them, and each process keeps one authorized session per
+# API. httplib2 connections are not thread-safe, so worker threads get their
+# own through thread_service.
+
+TOKEN_FILE = 'token.pickle'
+CLIENT_SECRET_FILE = 'client_secret_file.json'
+SHEETS_SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.send', 'https://www.googleapis.com/auth/gmail.compose', 'https://www.googleapis.com/auth/gmail.modify']
+HTTP_TIMEOUT = 120
+OAUTH_PORT = 8080
+
+_lock = threading.Lock()
+_credentials = {}
+_services = {}
+_thread_services = threading.local()
+
+def load_credentials(scopes, token_file=TOKEN_FILE, client_secret_file=CLIENT_SECRET_FILE):
+    """Credentials from token_file, refreshed or re-authorized in the browser when needed."""
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    creds = None
+    if os.path.exists(token_file):
+        with open(token_file, 'rb') as token:
+            creds = pickle.load(token)
+
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(client_secret_file, scopes)
+            creds = flow.run_local_server(port=OAUTH_PORT)
+        with open(token_file, 'wb') as token:
+            pickle.dump(creds, token)
+    return creds
+
+def get_credentials(scopes, token_file=TOKEN_FILE, client_secret_file=CLIENT_SECRET_FILE):
+    """load_credentials, once per process for each token file and set of scopes."""
+    key = (token_file, tuple(scopes))
+    with _lock:
+        if key not in _credentials:
+            _credentials[key] = load_credentials(scopes, token_file, client_secret_file)
+        return _credentials[key]
+
+def build_service(api, version, scopes, token_file=TOKEN_FILE):
+    """A new service object with its own authorized HTTP connection."""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+
+    http = AuthorizedHttp(get_credentials(scopes, token_file), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return build(api, version, http=http, static_discovery=True, cache_discovery=False)
+
+def get_service(api, version, scopes, token_file=TOKEN_FILE):
+    """The process-wide service for an API, built on first use."""
+    key = (api, version, token_file, tuple(scopes))
+    with _lock:
+        service = _services.get(key)
+    if service is None:
+        service = build_service(api, version, scopes, token_file)
+        with _lock:
+            service = _services.setdefault(key, service)
+    return service
+
+def thread_service(api, version, scopes, token_file=TOKEN_FILE):
+    """get_service for worker threads: one service, and so one connection, per thread."""
+    services = getattr(_thread_services, 'services', None)
+    if services is None:
+        services = _thread_services.services = {}
+    key = (api, version, token_file, tuple(scopes))
+    if key not in services:
+        services[key] = build_service(api, version, scopes, token_file)
+    return services[key]
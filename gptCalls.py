@@ -1,61 +1,84 @@
+import json
+import threading
 import openai
 from openai import ChatCompletion
-import pickle
-import os.path
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+
+import googleClients
+from enrichmentEngine import EnrichmentEngine
+from llmCache import LLMCache, cached
+from pipelineMetrics import METRICS
 
 openai.api_key = 'OPENAI_API_SECRET_KEY'
 
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-creds = None
-if os.path.exists('token.pickle'):
-    with open('token.pickle', 'rb') as token:
-        creds = pickle.load(token)
+ROLE_MODEL = "gpt-3.5-turbo"
+CATEGORY_MODEL = "gpt-3.5-turbo"
+CUSTOM_EMAIL_MODEL = "gpt-4"
 
-if not creds or not creds.valid:
-    if creds and creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file(
-            'client_secret_file.json', SCOPES)
-        creds = flow.run_local_server(port=8080)
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
+# Enrichment limits; MAX_ROWS = None enriches the whole sheet
+MAX_ROWS = None
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 40000
+BATCH_SIZE = 25  # Descriptions or (role, company) pairs per extract_roles/categorize_leads request
 
-service = build('sheets', 'v4', credentials=creds)
+# Responses are cached on disk, so re-runs and repeated (role, company) pairs cost no API calls
+LLM_CACHE_FILE = 'llm_cache.sqlite'
+LLM_CACHE_TTL = 60 * 60 * 24 * 30
+LLM_CACHE_MAX_ENTRIES = 200000
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+SCOPES = googleClients.SHEETS_SCOPES
 
 # Assuming you have a sheet ID
 SHEET_ID = '1KqChsN0FtaSN4lZrcJU57aPsIdx7NdssAonWOgQMXzw'
 RANGE_NAME = 'Pilot Scrape!A:Z'
-sheet = service.spreadsheets()
-result = sheet.values().get(spreadsheetId=SHEET_ID, range=RANGE_NAME).execute()
-values = result.get('values', [])
 
+def get_sheet():
+    # The Sheets client is only built, and the token only loaded, when a run actually needs it
+    return googleClients.get_service('sheets', 'v4', SCOPES).spreadsheets()
 
-def extract_role(text):
-    messages = [
-        {"role": "user", "content": "You are an assistant designed to extract the primary job title or function from a LinkedIn professional description. You should only return the role, nothing more. For example, given 'Manager, Commercial Strategy - Cardiovascular at The Janssen Pharmaceutical Companies of Johnson & Johnson', you should return Commercial Strategy Manager. Do not return any extra text."},
+
+def get_llm_cache():
+    # Opened on first use, so importing this module creates no database
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache(LLM_CACHE_FILE, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES)
+        return _llm_cache
+
+
+def uncached_chat_completion(model, messages):
+    response = openai.ChatCompletion.create(model=model, messages=messages)
+    return response.choices[0].message['content'].strip()
+
+def chat_completion(model, messages):
+    return cached(get_llm_cache(), model, messages, uncached_chat_completion)
+
+ROLE_INSTRUCTION = "You are an assistant designed to extract the primary job title or function from a LinkedIn professional description. You should only return the role, nothing more. For example, given 'Manager, Commercial Strategy - Cardiovascular at The Janssen Pharmaceutical Companies of Johnson & Johnson', you should return Commercial Strategy Manager. Do not return any extra text."
+CATEGORY_INSTRUCTION = "You are an assistant designed to categorize potential leads based on how best we can add value and appeal to their role and company. If we believe our services in artificial intelligence, especially generative models, can be impactful for the role or company, categorize it as 'GENERATIVE AI'. If our Diversity, Equity, and Inclusion solutions can assist the role or company's objectives, categorize it as 'DEI'. If our expertise in consumer product investigation, competitive analysis, industry trends, marketing efforts, or related fields can benefit the role or company, categorize it as 'CPEA'. If the role or company doesn't seem to fit prominently into any of these categories, categorize it as 'GENERAL'."
+LEAD_CATEGORIES = ['GENERAL', 'GENERATIVE AI', 'CPEA', 'DEI']
+
+def extract_role_messages(text):
+    return [
+        {"role": "user", "content": ROLE_INSTRUCTION},
         {"role": "user", "content": f"Here is the LinkedIn Professional Description. Please return what is required: '{text}'."}
     ]
-    
-    response = openai.ChatCompletion.create(model="gpt-3.5-turbo", messages=messages)
-    role = response.choices[0].message['content'].strip()
-    return role
 
-def categorize_lead(role, company):
-    messages = [
-        {"role": "user", "content": "You are an assistant designed to categorize potential leads based on how best we can add value and appeal to their role and company. If we believe our services in artificial intelligence, especially generative models, can be impactful for the role or company, categorize it as 'GENERATIVE AI'. If our Diversity, Equity, and Inclusion solutions can assist the role or company's objectives, categorize it as 'DEI'. If our expertise in consumer product investigation, competitive analysis, industry trends, marketing efforts, or related fields can benefit the role or company, categorize it as 'CPEA'. If the role or company doesn't seem to fit prominently into any of these categories, categorize it as 'GENERAL'."},
+def extract_role(text):
+    return chat_completion(ROLE_MODEL, extract_role_messages(text))
+
+def categorize_lead_messages(role, company):
+    return [
+        {"role": "user", "content": CATEGORY_INSTRUCTION},
         {"role": "user", "content": f"The role is: '{role}' and the company is: '{company}'. Considering how best we can appeal to and assist this role and company, please categorize this lead. Remember to ONLY return one of the following: GENERAL, GENERATIVE AI, CPEA, or DEI. Do not include any more text or symbols or quotes."}
     ]
-    
-    response = openai.ChatCompletion.create(model="gpt-3.5-turbo", messages=messages)
-    category = response.choices[0].message['content'].strip()
-    return category
 
-def customized_email_portion(role, company):
-    messages = [
+def categorize_lead(role, company):
+    return chat_completion(CATEGORY_MODEL, categorize_lead_messages(role, company))
+
+def customized_email_messages(role, company):
+    return [
         {"role": "user", "content": "You are assisting a boutique consulting firm in tailoring a portion of an outreach email. This firm has expertise in various areas including go-to-market strategy, competitor analysis, and industry/consumer research. The objective is to draw a connection between the firm's services and the recipient's professional role and company. This connection will fit into the middle of the email, following a sentence where the writer has expressed an interest in discussing collaboration based on the recipient's work at their company. Here's the larger context of the email:"},
         {"role": "user", "content": """
         "Dear [Recipient Name],
@@ -81,34 +104,86 @@ def customized_email_portion(role, company):
         {"role": "user", "content": f"Given the recipient's role as a '{role}' at '{company}', craft a tailored segment that naturally establishes a connection between our consulting services and the recipient's role at their company. This segment should flow naturally from the preceding sentence and lead into the introduction of Vasuman Moza. Please ONLY return the exact text that will replace the [Your text should fit here seamlessly...] placeholder in the email. Ensure that it reads naturally and seamlessly within the overall context. Again, only return the text that will be copy pasted over the [Your text], do not actually return [Your Text] or anything like that. "}
     ]
 
-    response = openai.ChatCompletion.create(model="gpt-4", messages=messages)
-    custom_content = response.choices[0].message['content'].strip()
-    return custom_content
-
-
-if not values:
-    print('No data found.')
-else:
-    customized_portions = []
-    num = 0
-    
-    # Limit processing to the first 50 rows or the total number of rows, whichever is smaller
-    max_rows = min(50, len(values) - 1) # subtract 1 to account for the header row
-    
-    for row in values[1:max_rows+1]: # Start from index 1 to skip the header
-        num += 1
-        role_description = row[7]  # Assuming the 8th column is 'Role'
-        company_name = row[2]      # Assuming the 3rd column is 'Company'
-        
-        # Get the customized email portion for the specific role and company
-        customized_portions.append([customized_email_portion(role_description, company_name)])
-        print("Called API", num, "times")
-
-    # Update your sheet with the generated customized email portions, perhaps in a new column
-    update_range = 'K2:K' + str(num + 1)  # Adjusting the update range based on the number of processed rows
-    body = {'values': customized_portions}
-    result = sheet.values().update(spreadsheetId=SHEET_ID, range=update_range, valueInputOption="RAW", body=body).execute()
-    print(f"{result.get('updatedCells')} cells updated with customized email portions.")
+def customized_email_portion(role, company):
+    return chat_completion(CUSTOM_EMAIL_MODEL, customized_email_messages(role, company))
+
+def extract_roles_batch_messages(texts):
+    return [
+        {"role": "user", "content": ROLE_INSTRUCTION},
+        {"role": "user", "content": f"Here are {len(texts)} LinkedIn Professional Descriptions as a JSON array: {json.dumps([text for (text,) in texts])}. Return ONLY a JSON array of {len(texts)} strings, the role for each description, in the same order. Do not return any other text."}
+    ]
+
+def categorize_leads_batch_messages(roles_and_companies):
+    leads = [{"role": role, "company": company} for role, company in roles_and_companies]
+    return [
+        {"role": "user", "content": CATEGORY_INSTRUCTION},
+        {"role": "user", "content": f"Here are {len(leads)} leads as a JSON array: {json.dumps(leads)}. Considering how best we can appeal to and assist each role and company, categorize every lead. Return ONLY a JSON array of {len(leads)} strings in the same order, each one of: GENERAL, GENERATIVE AI, CPEA, or DEI. Do not return any other text."}
+    ]
+
+def validate_role(value):
+    role = str(value).strip().strip('"\'')
+    if not role:
+        raise ValueError("empty role")
+    return role
+
+def validate_category(value):
+    category = str(value).strip().strip('"\'').upper()
+    if category not in LEAD_CATEGORIES:
+        raise ValueError(f"unknown lead category {value!r}")
+    return category
+
+def extract_roles(texts, engine, batch_size=BATCH_SIZE):
+    """extract_role for many descriptions, packing batch_size distinct descriptions into each call."""
+    return engine.run_batched(ROLE_MODEL, [(text,) for text in texts], extract_roles_batch_messages, validate_role,
+                              batch_size, extract_role_messages)
+
+def categorize_leads(roles_and_companies, engine, batch_size=BATCH_SIZE):
+    """categorize_lead for many (role, company) pairs, packing batch_size distinct pairs into each call."""
+    return engine.run_batched(CATEGORY_MODEL, list(roles_and_companies), categorize_leads_batch_messages, validate_category,
+                              batch_size, categorize_lead_messages)
+
+def customized_email_portions(rows, engine):
+    """Generate the custom paragraph for every row, one API call per distinct (role, company)."""
+    roles_and_companies = []
+    for row in rows:
+        role_description = row[7] if len(row) > 7 else ''  # Assuming the 8th column is 'Role'
+        company_name = row[2] if len(row) > 2 else ''      # Assuming the 3rd column is 'Company'
+        roles_and_companies.append((role_description, company_name))
+
+    results = engine.run_unique(CUSTOM_EMAIL_MODEL, roles_and_companies, customized_email_messages)
+    for n, result in enumerate(results, start=2):
+        if isinstance(result, Exception):
+            print(f"Row {n}: enrichment failed ({result!r}), leaving it blank.")
+    return [['' if isinstance(result, Exception) else result] for result in results]
+
+def main():
+    sheet = get_sheet()
+    result = METRICS.execute('sheets.values.get', sheet.values().get(spreadsheetId=SHEET_ID, range=RANGE_NAME))
+    values = result.get('values', [])
+
+    if not values:
+        print('No data found.')
+    else:
+        rows = values[1:] if MAX_ROWS is None else values[1:MAX_ROWS + 1]  # Skip the header row
+        engine = EnrichmentEngine(concurrency=CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE, cache=get_llm_cache())
+
+        # Get the customized email portion for every row's role and company
+        with METRICS.stage('enrich', len(rows)) as stage:
+            customized_portions = customized_email_portions(rows, engine)
+            stage.rows_out = len(customized_portions)
+        print("Enrichment finished:", engine.summary())
+
+        # Update your sheet with the generated customized email portions, perhaps in a new column
+        update_range = 'K2:K' + str(len(rows) + 1)  # Adjusting the update range based on the number of processed rows
+        body = {'values': customized_portions}
+        result = METRICS.execute('sheets.values.update', sheet.values().update(spreadsheetId=SHEET_ID, range=update_range, valueInputOption="RAW", body=body))
+        print(f"{result.get('updatedCells')} cells updated with customized email portions.")
+
+    llm_cache = get_llm_cache()
+    print(llm_cache.summary())
+    METRICS.record_cache('llm_cache', llm_cache.hits, llm_cache.misses)
+    llm_cache.evict()
+    METRICS.write_report()
 
     # results_35 = []
     # for row in values:
@@ -120,3 +195,6 @@ else:
     # body_H = {'values': results_35}
     # result_H = sheet.values().update(spreadsheetId=SHEET_ID, range=update_range_H, valueInputOption="RAW", body=body_H).execute()
     # print(f"{result_H.get('updatedCells')} cells updated in column H with GPT-3.5 results.")
+
+if __name__ == '__main__':
+    main()
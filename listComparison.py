@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import contactSchema
+import contactStore
+from emailCanon import MISSING_KEY, emailKeys
+
+# Set comparison of two email lists on emailCanon keys. Each side is reduced to
+# its unique keys (remembering where each first appeared), the two key arrays
+# are sorted together once, and a key sitting next to its twin is in both
+# lists; everything else is only in its own. So intersection, left-only and
+# right-only all come out of a single sort, without merging any other columns.
+# Emails are matched the way dedup matches them, ignoring case and surrounding
+# whitespace; rows without an email are left out of every partition.
+
+class ListComparison:
+    """Emails in both lists, only in the left and only in the right, as EMAIL DataFrames.
+
+    Emails are unique within each partition and keep the spelling and order of
+    their first appearance, from the left list for both and left_only.
+    """
+
+    __slots__ = ('both', 'left_only', 'right_only')
+
+    def __init__(self, both, left_only, right_only):
+        self.both = both
+        self.left_only = left_only
+        self.right_only = right_only
+
+    def counts(self):
+        return {'both': len(self.both), 'left_only': len(self.left_only), 'right_only': len(self.right_only)}
+
+    def __repr__(self):
+        return 'ListComparison(' + ', '.join(f"{name}={count}" for name, count in self.counts().items()) + ')'
+
+def uniqueKeys(keys):
+    """(unique keys other than MISSING_KEY, index of each one's first occurrence), in order of first occurrence."""
+    unique, first = np.unique(keys, return_index = True)
+    present = unique != MISSING_KEY
+    unique, first = unique[present], first[present]
+    order = np.argsort(first, kind = 'stable')
+    return unique[order], first[order]
+
+def sharedKeys(left_unique, right_unique):
+    """Boolean arrays marking which of two unique key arrays also appear in the other."""
+    keys = np.concatenate([left_unique, right_unique])
+    order = np.argsort(keys, kind = 'stable')
+    # Within each side keys are unique, so equal neighbours are one left key and its right twin
+    matched = np.flatnonzero(keys[order[1:]] == keys[order[:-1]])
+    shared = np.zeros(len(keys), dtype = bool)
+    shared[order[matched]] = True
+    shared[order[matched + 1]] = True
+    return shared[:len(left_unique)], shared[len(left_unique):]
+
+def _emailFrame(values):
+    return pd.DataFrame({'EMAIL': values})
+
+def compareEmails(left_emails, right_emails, gmail_rules = None):
+    """ListComparison of two Series (or sequences) of raw emails."""
+    left = np.asarray(left_emails, dtype = object)
+    right = np.asarray(right_emails, dtype = object)
+    left_unique, left_first = uniqueKeys(emailKeys(left, gmail_rules))
+    right_unique, right_first = uniqueKeys(emailKeys(right, gmail_rules))
+    left_shared, right_shared = sharedKeys(left_unique, right_unique)
+    return ListComparison(_emailFrame(left[left_first[left_shared]]),
+                          _emailFrame(left[left_first[~left_shared]]),
+                          _emailFrame(right[right_first[~right_shared]]))
+
+def compareFrames(left_df, right_df, gmail_rules = None):
+    return compareEmails(left_df['EMAIL'], right_df['EMAIL'], gmail_rules)
+
+def workbookEmails(file_path):
+    """Every sheet's EMAIL column, one after another; the contact store reads no other column."""
+    emails = []
+    for df in contactStore.readSheets(file_path, ['EMAIL']):
+        df = contactSchema.rename_frame_columns(df)
+        if 'EMAIL' in df.columns:
+            emails.append(df['EMAIL'].to_numpy(dtype = object))
+    return np.concatenate(emails) if emails else np.empty(0, dtype = object)
+
+def compareWorkbooks(left_file_path, right_file_path, gmail_rules = None):
+    return compareEmails(workbookEmails(left_file_path), workbookEmails(right_file_path), gmail_rules)
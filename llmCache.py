@@ -0,0 +1,92 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Disk-backed cache of chat completions, keyed by a hash of the model name and
+# the rendered messages. Entries expire after a TTL and the least recently used
+# ones are evicted once the cache holds more than max_entries.
+
+DEFAULT_CACHE_PATH = 'llm_cache.sqlite'
+DEFAULT_TTL = 60 * 60 * 24 * 30
+DEFAULT_MAX_ENTRIES = 200000
+
+def cache_key(model, messages):
+    payload = json.dumps({'model': model, 'messages': messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class LLMCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, accessed REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.connection.commit()
+
+    def get(self, model, messages):
+        key = cache_key(model, messages)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self.connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, model, messages, response):
+        now = time.time()
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                    (cache_key(model, messages), model, response, now, now))
+            self.connection.commit()
+
+    def delete(self, model, messages):
+        with self.lock:
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (cache_key(model, messages),))
+            self.connection.commit()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries."""
+        with self.lock:
+            if self.ttl is not None:
+                self.connection.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.ttl,))
+            if self.max_entries is not None:
+                self.connection.execute(
+                    'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,))
+            self.connection.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        return f"cache: {self.hits} hits, {self.misses} misses ({self.hit_rate():.1%} hit rate)"
+
+    def close(self):
+        self.evict()
+        self.connection.close()
+
+def cached(cache, model, messages, complete):
+    """Return the cached response for (model, messages), calling complete() on a miss."""
+    response = cache.get(model, messages)
+    if response is None:
+        response = complete(model, messages)
+        cache.set(model, messages, response)
+    return response
@@ -0,0 +1,196 @@
+import json
+import time
+import bisect
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Run instrumentation shared by dataCleaning, consolidateEmails, gptCalls and
+# gmailCalls. Pipeline stages record wall time, row counts and, when memory is
+# tracked, the tracemalloc peak reached inside them; network calls record
+# a latency histogram, errors and retries per API; caches report hits and
+# misses. Everything lands in one JSON run report, built from the counts the
+# pipeline already has in hand rather than by re-reading what it wrote.
+
+REPORT_FILE = 'pipeline_report.json'
+# tracemalloc makes allocation-heavy stages several times slower, so peaks are
+# only recorded with TRACK_MEMORY on or when it is already tracing (python -X tracemalloc)
+TRACK_MEMORY = False
+
+# Upper bounds, in seconds, of the latency histogram buckets; slower calls land in a final overflow bucket
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, capped at the slowest call seen."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for n, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.buckets[n], self.max) if n < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+            'buckets': {('<=%g' % bound if n < len(self.buckets) else '>%g' % self.buckets[-1]): count
+                        for n, (bound, count) in enumerate(zip(self.buckets + (None,), self.counts)) if count},
+        }
+
+class Stage:
+    """One pass through a stage; set rows_out (and rows_in, if not known up front) inside the with block."""
+
+    __slots__ = ('name', 'rows_in', 'rows_out')
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+class PipelineMetrics:
+    def __init__(self, track_memory=TRACK_MEMORY):
+        self.track_memory = track_memory
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = _now()
+            self.clock = time.perf_counter()
+            self.stages = {}
+            self.apis = {}
+            self.caches = {}
+            self.counters = {}
+            self.outputs = {}
+            self._peaks = []  # running tracemalloc peak of each open stage, innermost last
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time a pipeline stage; passes through the same name add up, and stages may nest."""
+        stage = Stage(name, rows_in)
+        tracking = (self.track_memory or tracemalloc.is_tracing()) and threading.current_thread() is threading.main_thread()
+        if tracking:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # reset_peak is global, so fold what the enclosing stage has reached so far into its running peak
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            seconds = time.perf_counter() - start
+            peak = None
+            if tracking:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+            self._record_stage(stage, seconds, peak)
+
+    def _record_stage(self, stage, seconds, peak):
+        with self.lock:
+            stats = self.stages.setdefault(stage.name, {'calls': 0, 'seconds': 0.0, 'rows_in': None, 'rows_out': None, 'peak_bytes': None})
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            for field in ('rows_in', 'rows_out'):
+                value = getattr(stage, field)
+                if value is not None:
+                    stats[field] = (stats[field] or 0) + int(value)
+            if peak is not None:
+                stats['peak_bytes'] = max(stats['peak_bytes'] or 0, peak)
+
+    def _api(self, name):
+        api = self.apis.get(name)
+        if api is None:
+            api = self.apis[name] = {'calls': 0, 'errors': 0, 'retries': 0, 'latency': LatencyHistogram()}
+        return api
+
+    @contextmanager
+    def api_call(self, name):
+        """Time one network call to the named API, counting it as an error if it raises."""
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                api = self._api(name)
+                api['calls'] += 1
+                api['errors'] += failed
+                api['latency'].observe(seconds)
+
+    def execute(self, name, request):
+        """request.execute() for a googleapiclient request, timed as a call to name."""
+        with self.api_call(name):
+            return request.execute()
+
+    def retry(self, name, count=1):
+        with self.lock:
+            self._api(name)['retries'] += count
+
+    def count(self, name, count=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def record_cache(self, name, hits, misses):
+        """Hit and miss totals of a cache, as it reports them at the end of a run."""
+        with self.lock:
+            lookups = hits + misses
+            self.caches[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / lookups if lookups else None}
+
+    def record_output(self, path, rows, sheets=None):
+        """What a stage wrote, so the report never has to re-read the file to count it."""
+        with self.lock:
+            self.outputs[path] = {'rows': int(rows), 'sheets': sheets}
+
+    def report(self):
+        with self.lock:
+            return {
+                'started': self.started,
+                'finished': _now(),
+                'seconds': time.perf_counter() - self.clock,
+                'stages': {name: dict(stats) for name, stats in self.stages.items()},
+                'apis': {name: dict(api, latency=api['latency'].to_dict()) for name, api in self.apis.items()},
+                'caches': dict(self.caches),
+                'counters': dict(self.counters),
+                'outputs': dict(self.outputs),
+            }
+
+    def write_report(self, path=REPORT_FILE):
+        report = self.report()
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+        return report
+
+# The process-wide collector every module records into
+METRICS = PipelineMetrics()
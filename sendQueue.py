@@ -0,0 +1,241 @@
+import time
+import random
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pipelineMetrics import METRICS
+
+# Durable bulk sender for gmailCalls. Every recipient of a campaign (one draft)
+# is recorded in SQLite before anything is sent, workers claim rows one at a
+# time, and each Gmail message id is written back as soon as the send returns,
+# so a crashed run picks up exactly where it stopped.
+
+DEFAULT_QUEUE_PATH = 'send_queue.sqlite'
+
+# Gmail allows 250 quota units per user per second and messages.send costs 100.
+SENDS_PER_SECOND = 2.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+PENDING = 'PENDING'
+IN_FLIGHT = 'IN_FLIGHT'
+SENT = 'SENT'
+FAILED = 'FAILED'
+
+def get_status(error):
+    resp = getattr(error, 'resp', None)
+    return getattr(resp, 'status', None) or getattr(error, 'status_code', None)
+
+def is_retryable(error):
+    status = get_status(error)
+    if status in RETRYABLE_STATUS:
+        return True
+    # Gmail reports per-user rate limits as 403s
+    return status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+
+class TokenBucket:
+    """Thread-safe limiter allowing `rate` acquisitions per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class SendQueue:
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS sends ('
+            'campaign TEXT, email TEXT, name TEXT, company TEXT, status TEXT, message_id TEXT, '
+            'attempts INTEGER DEFAULT 0, error TEXT, updated REAL, PRIMARY KEY (campaign, email))')
+        self.connection.commit()
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            cursor = self.connection.execute(sql, params)
+            self.connection.commit()
+            return cursor
+
+    def enqueue(self, campaign, recipients):
+        """Add (email, name, company) recipients; ones already queued for the campaign are left alone."""
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO sends (campaign, email, name, company, status, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                [(campaign, email, name, company, PENDING, time.time()) for email, name, company in recipients])
+            self.connection.commit()
+            return self.connection.total_changes - before
+
+    def recover(self, campaign, resend_in_flight=False):
+        """Deal with rows a crashed run left IN_FLIGHT.
+
+        Those sends may or may not have gone out, so by default they are marked
+        FAILED for a manual check rather than risking a duplicate email.
+        """
+        status = PENDING if resend_in_flight else FAILED
+        return self._execute('UPDATE sends SET status = ?, error = ?, updated = ? WHERE campaign = ? AND status = ?',
+                             (status, 'interrupted mid-send', time.time(), campaign, IN_FLIGHT)).rowcount
+
+    def claim_many(self, campaign, limit):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT email, name, company FROM sends WHERE campaign = ? AND status = ? ORDER BY rowid LIMIT ?',
+                (campaign, PENDING, limit)).fetchall()
+            self.connection.executemany(
+                'UPDATE sends SET status = ?, attempts = attempts + 1, updated = ? WHERE campaign = ? AND email = ?',
+                [(IN_FLIGHT, time.time(), campaign, row[0]) for row in rows])
+            self.connection.commit()
+            return rows
+
+    def claim(self, campaign):
+        rows = self.claim_many(campaign, 1)
+        return rows[0] if rows else None
+
+    def mark_sent(self, campaign, email, message_id):
+        self._execute('UPDATE sends SET status = ?, message_id = ?, error = NULL, updated = ? WHERE campaign = ? AND email = ?',
+                      (SENT, message_id, time.time(), campaign, email))
+
+    def mark_failed(self, campaign, email, error):
+        self._execute('UPDATE sends SET status = ?, error = ?, updated = ? WHERE campaign = ? AND email = ?',
+                      (FAILED, str(error)[:500], time.time(), campaign, email))
+
+    def retry_failed(self, campaign):
+        return self._execute('UPDATE sends SET status = ?, updated = ? WHERE campaign = ? AND status = ?',
+                             (PENDING, time.time(), campaign, FAILED)).rowcount
+
+    def counts(self, campaign):
+        with self.lock:
+            rows = self.connection.execute('SELECT status, COUNT(*) FROM sends WHERE campaign = ? GROUP BY status', (campaign,))
+            return dict(rows.fetchall())
+
+    def close(self):
+        self.connection.close()
+
+class BulkSender:
+    """Sends every PENDING row of a campaign from a pool of worker threads.
+
+    service_factory builds a Gmail service; each worker makes its own because
+    the API client's HTTP object is not thread-safe. build_message(email, name,
+    company) returns the {'raw': ...} body for messages().send.
+    """
+
+    def __init__(self, queue, service_factory, build_message, workers=4, sends_per_second=SENDS_PER_SECOND,
+                 max_retries=5, base_delay=1.0, max_delay=64.0, batch_size=1):
+        self.queue = queue
+        self.service_factory = service_factory
+        self.build_message = build_message
+        self.workers = workers
+        self.bucket = TokenBucket(sends_per_second)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.retries = 0
+
+    def backoff(self, attempt):
+        time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def build(self, campaign, email, name, company):
+        try:
+            return self.build_message(email, name, company)
+        except Exception as error:
+            self.queue.mark_failed(campaign, email, error)
+            print(f'could not build message for {email}: {error}')
+            return None
+
+    def send_one(self, service, campaign, email, name, company):
+        message = self.build(campaign, email, name, company)
+        if message is None:
+            return
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                sent = METRICS.execute('gmail.messages.send', service.users().messages().send(userId='me', body=message))
+            except Exception as error:
+                if attempt == self.max_retries or not is_retryable(error):
+                    self.queue.mark_failed(campaign, email, error)
+                    print(f'failed to send to {email}: {error}')
+                    return
+                self.retries += 1
+                METRICS.retry('gmail.messages.send')
+                self.backoff(attempt)
+            else:
+                self.queue.mark_sent(campaign, email, sent['id'])
+                print(F'sent message to {email} Message Id: {sent["id"]}')
+                return
+
+    def send_batch(self, service, campaign, rows):
+        """Send several rows in one batch HTTP request, retrying only the items that hit rate limits."""
+        pending = []
+        for email, name, company in rows:
+            message = self.build(campaign, email, name, company)
+            if message is not None:
+                pending.append((email, message))
+
+        for attempt in range(self.max_retries + 1):
+            if not pending:
+                return
+            retry = []
+
+            def callback(request_id, response, exception):
+                email, message = pending[int(request_id)]
+                if exception is None:
+                    self.queue.mark_sent(campaign, email, response['id'])
+                    print(F'sent message to {email} Message Id: {response["id"]}')
+                elif attempt < self.max_retries and is_retryable(exception):
+                    retry.append((email, message))
+                else:
+                    self.queue.mark_failed(campaign, email, exception)
+                    print(f'failed to send to {email}: {exception}')
+
+            batch = service.new_batch_http_request(callback=callback)
+            for n, (email, message) in enumerate(pending):
+                self.bucket.acquire()
+                batch.add(service.users().messages().send(userId='me', body=message), request_id=str(n))
+            try:
+                METRICS.execute('gmail.batch', batch)
+            except Exception as error:
+                if attempt == self.max_retries or not is_retryable(error):
+                    for email, _ in pending:
+                        self.queue.mark_failed(campaign, email, error)
+                    print(f'failed to send a batch of {len(pending)}: {error}')
+                    return
+                retry = pending
+            pending = retry
+            if pending:
+                self.retries += len(pending)
+                METRICS.retry('gmail.batch', len(pending))
+                self.backoff(attempt)
+
+    def _worker(self, campaign):
+        service = self.service_factory()
+        while True:
+            rows = self.queue.claim_many(campaign, self.batch_size)
+            if not rows:
+                return
+            if self.batch_size == 1:
+                self.send_one(service, campaign, *rows[0])
+            else:
+                self.send_batch(service, campaign, rows)
+
+    def run(self, campaign):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for future in [executor.submit(self._worker, campaign) for _ in range(self.workers)]:
+                future.result()
+        return self.queue.counts(campaign)
@@ -0,0 +1,81 @@
+import bisect
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# Splits a contact list into sender sheets without cutting companies apart.
+# Rows are grouped by company once (factorized codes plus their counts), whole
+# companies are packed into sheets of at most max_rows, largest first and each
+# into the fullest sheet it still fits, and only a company bigger than a sheet
+# is split, into full sheets of its own plus a remainder packed like any other
+# company. Sheets list their companies alphabetically, are ordered by their
+# first company, and go to the senders round-robin. Each plan carries the
+# company with the most rows in it, for the sheet name.
+
+SENDERS = ('VAS', 'JAKE')
+
+SheetPlan = namedtuple('SheetPlan', ['rows', 'company', 'sender'])  # rows: positions in the input, in sheet order
+
+def companyGroups(companies):
+    """(group code per row, company name per code, rows per code); codes follow the names' sort order, missing companies last."""
+    codes, names = pd.factorize(pd.Series(companies, dtype = object), sort = True)
+    names = list(names)
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(names), codes)
+        names.append(None)
+    return codes, names, np.bincount(codes, minlength = len(names))
+
+def packGroups(sizes, max_rows):
+    """Best-fit decreasing: lists of (code, offset, count) pieces, one list per sheet, none over max_rows rows."""
+    sheets, space = [], []  # space: sorted (rows left, sheet number) of sheets that are not full
+    for code in np.argsort(-sizes, kind = 'stable').tolist():
+        size, offset = int(sizes[code]), 0
+        while size - offset > max_rows:
+            sheets.append([(code, offset, max_rows)])
+            offset += max_rows
+        count = size - offset
+        n = bisect.bisect_left(space, (count, -1))
+        if n < len(space):
+            left, sheet = space.pop(n)
+        else:
+            left, sheet = max_rows, len(sheets)
+            sheets.append([])
+        sheets[sheet].append((code, offset, count))
+        if left > count:
+            bisect.insort(space, (left - count, sheet))
+    for pieces in sheets:
+        pieces.sort()
+    sheets.sort()
+    return sheets
+
+def dominantCompany(pieces, names):
+    """The company with the most rows among pieces, the alphabetically first on ties, like Series.mode()."""
+    named = [(-count, code) for code, offset, count in pieces if names[code] is not None]
+    return names[min(named)[1]] if named else ''
+
+def planSheets(companies, max_rows, senders = SENDERS):
+    """SheetPlans for a sequence of companies, one per sheet of at most max_rows rows."""
+    codes, names, sizes = companyGroups(companies)
+    order = np.argsort(codes, kind = 'stable')  # rows grouped by company, in input order within each
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    plans = []
+    for n, pieces in enumerate(packGroups(sizes, max_rows)):
+        rows = np.concatenate([order[starts[code] + offset:starts[code] + offset + count] for code, offset, count in pieces])
+        plans.append(SheetPlan(rows, dominantCompany(pieces, names), senders[n % len(senders)]))
+    return plans
+
+def partitionDataFrame(df, max_rows, senders = SENDERS):
+    """df split into sheets by planSheets; each sheet's attrs hold its 'COMPANY' label and 'SENDER'."""
+    plans = planSheets(df['COMPANY'], max_rows, senders)
+    if not plans:
+        return []
+    # One take puts every row in sheet order; the sheets are then plain slices of it
+    ordered = df.iloc[np.concatenate([plan.rows for plan in plans])]
+    partitions, start = [], 0
+    for plan in plans:
+        partition = ordered.iloc[start:start + len(plan.rows)]
+        partition.attrs = {'COMPANY': plan.company, 'SENDER': plan.sender}
+        partitions.append(partition)
+        start += len(plan.rows)
+    return partitions
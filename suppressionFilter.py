@@ -0,0 +1,129 @@
+import os
+import json
+import math
+import numpy as np
+
+# Compact, memory-mapped membership test over emailCanon keys, kept next to the
+# suppression index. A Bloom filter rejects most addresses after a few bit
+# probes; only its probable hits are confirmed by binary search in the sorted
+# array of exact keys. Both files are opened with np.memmap, so loading costs
+# the same no matter how long the DO NOT EMAIL list gets. The key scheme the
+# keys were made with (emailCanon.keyScheme) is saved beside them, so keys from
+# another hash or other gmail rules are never mistaken for current ones.
+
+BLOOM_FILE = 'bloom.bin'
+KEYS_FILE = 'keys.u64'
+SCHEME_FILE = 'keys.json'
+FALSE_POSITIVE_RATE = 0.01
+BLOOM_HEADER_BYTES = 16  # little-endian uint64 bit count, then uint64 probe count
+
+def _memmap(path, dtype, offset = 0):
+    # np.memmap refuses empty files
+    if os.path.getsize(path) <= offset:
+        return np.empty(0, dtype = dtype)
+    return np.memmap(path, dtype = dtype, mode = 'r', offset = offset)
+
+class BloomFilter:
+    def __init__(self, bits, num_bits, num_hashes):
+        self.bits = bits
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+
+    @classmethod
+    def fromKeys(cls, keys, false_positive_rate = FALSE_POSITIVE_RATE):
+        count = max(len(keys), 1)
+        num_bits = max(64, int(math.ceil(-count * math.log(false_positive_rate) / math.log(2) ** 2 / 8)) * 8)
+        num_hashes = max(1, round(num_bits / count * math.log(2)))
+        bloom = cls(None, num_bits, num_hashes)
+        flags = np.zeros(num_bits, dtype = bool)
+        for probe in range(num_hashes):
+            flags[bloom._positions(keys, probe)] = True
+        bloom.bits = np.packbits(flags, bitorder = 'little')
+        return bloom
+
+    def _positions(self, keys, probe):
+        # Double hashing on the two halves of the 64-bit key
+        keys = np.asarray(keys, dtype = np.uint64)
+        step = (keys >> np.uint64(32)) | np.uint64(1)
+        return ((keys & np.uint64(0xFFFFFFFF)) + np.uint64(probe) * step) % np.uint64(self.num_bits)
+
+    def mightContainKeys(self, keys):
+        """False means definitely absent; True means present or a false positive."""
+        keys = np.asarray(keys, dtype = np.uint64)
+        candidates = np.arange(len(keys))
+        for probe in range(self.num_hashes):
+            if not len(candidates):
+                break
+            positions = self._positions(keys[candidates], probe)
+            hit = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+            candidates = candidates[hit.astype(bool)]
+        result = np.zeros(len(keys), dtype = bool)
+        result[candidates] = True
+        return result
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(np.array([self.num_bits, self.num_hashes], dtype = '<u8').tobytes())
+            file.write(np.asarray(self.bits, dtype = np.uint8).tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            num_bits, num_hashes = np.frombuffer(file.read(BLOOM_HEADER_BYTES), dtype = '<u8').tolist()
+        return cls(_memmap(path, np.uint8, BLOOM_HEADER_BYTES), num_bits, num_hashes)
+
+class SuppressionFilter:
+    """Bloom prefilter plus sorted exact keys, built from and answering in emailCanon keys."""
+
+    def __init__(self, keys, bloom, scheme = None):
+        self.keys = keys
+        self.bloom = bloom
+        self.scheme = scheme
+
+    @classmethod
+    def fromKeys(cls, keys, scheme, false_positive_rate = FALSE_POSITIVE_RATE):
+        keys = np.unique(np.asarray(keys, dtype = np.uint64))
+        return cls(keys, BloomFilter.fromKeys(keys, false_positive_rate), scheme)
+
+    @classmethod
+    def exists(cls, directory, scheme):
+        """Whether the keys and Bloom filter are there and were built with scheme."""
+        paths = [os.path.join(directory, name) for name in (KEYS_FILE, BLOOM_FILE, SCHEME_FILE)]
+        if not all(os.path.exists(path) for path in paths):
+            return False
+        with open(paths[2], 'r') as file:
+            return json.load(file) == scheme
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, SCHEME_FILE), 'r') as file:
+            scheme = json.load(file)
+        return cls(_memmap(os.path.join(directory, KEYS_FILE), '<u8'), BloomFilter.load(os.path.join(directory, BLOOM_FILE)), scheme)
+
+    def save(self, directory):
+        # Written under temporary names and swapped in, so a reader never maps half a file. The old scheme
+        # goes first and the new one last, so an interrupted save is rebuilt rather than trusted.
+        scheme_path = os.path.join(directory, SCHEME_FILE)
+        if os.path.exists(scheme_path):
+            os.remove(scheme_path)
+        for name, write in ((KEYS_FILE, lambda path: np.asarray(self.keys, dtype = '<u8').tofile(path)), (BLOOM_FILE, self.bloom.save)):
+            path = os.path.join(directory, name)
+            write(path + '.tmp')
+            os.replace(path + '.tmp', path)
+        with open(scheme_path + '.tmp', 'w') as file:
+            json.dump(self.scheme, file)
+        os.replace(scheme_path + '.tmp', scheme_path)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def containsKeys(self, keys):
+        keys = np.asarray(keys, dtype = np.uint64)
+        result = np.zeros(len(keys), dtype = bool)
+        if not len(self.keys) or not len(keys):
+            return result
+        probable = np.flatnonzero(self.bloom.mightContainKeys(keys))
+        if len(probable):
+            positions = np.searchsorted(self.keys, keys[probable]).clip(max = len(self.keys) - 1)
+            result[probable] = self.keys[positions] == keys[probable]
+        return result
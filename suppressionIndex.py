@@ -0,0 +1,193 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import contactSchema
+import contactStore
+import emailCanon
+from suppressionFilter import KEYS_FILE, SuppressionFilter
+
+# Persistent DO NOT EMAIL index kept next to the workbook in '<name>.suppression/':
+#   snapshot.txt  sorted canonical emails (see emailCanon) as of the last compaction
+#   log.txt       emails added since then, one per line, append-only
+#   source.json   size/mtime of the .xlsx last merged in, so hand edits are picked up
+#   keys.u64, bloom.bin  the snapshot's emailCanon keys, sorted, and a Bloom filter over them
+#   keys.json     the emailCanon.keyScheme those keys were made with
+# Opening the index memory-maps the key files and reads only the log, so its
+# cost stays flat as the snapshot grows; the snapshot's emails themselves are
+# only loaded for compaction and export. Membership is a Bloom probe confirmed
+# against the sorted keys, plus a lookup in the log's EmailSet, and adding
+# bounces only appends to the log. The workbook is only rewritten by exportToExcel.
+
+SUPPRESSION_SUFFIX = '.suppression'
+COMPACT_MIN_LOG_ENTRIES = 10000
+_INDEXES = {}
+
+class SuppressionIndex:
+    def __init__(self, excel_path):
+        self.excel_path = excel_path
+        self.index_path = os.path.splitext(excel_path)[0] + SUPPRESSION_SUFFIX
+        self.snapshot_path = os.path.join(self.index_path, 'snapshot.txt')
+        self.log_path = os.path.join(self.index_path, 'log.txt')
+        self.source_path = os.path.join(self.index_path, 'source.json')
+        self.filter = None   # SuppressionFilter over the snapshot
+        self.recent = None   # EmailSet of the log
+        self._emails = None  # Every suppressed email, loaded on demand
+        self.log_entries = 0
+        self.load()
+
+    def load(self):
+        os.makedirs(self.index_path, exist_ok = True)
+        self._emails = None
+        self.filter = self._loadFilter()
+        log = self._readLines(self.log_path)
+        self.log_entries = len(log)
+        self.recent = emailCanon.EmailSet(log)
+        self.syncFromExcel()
+        if self.log_entries >= COMPACT_MIN_LOG_ENTRIES and self.log_entries * 2 >= len(self):
+            self.compact()
+
+    def _loadFilter(self):
+        """Map the snapshot's key files, rebuilding them if they are missing, older than the snapshot or from another key scheme."""
+        if SuppressionFilter.exists(self.index_path, emailCanon.keyScheme()) and not self._snapshotNewerThanFilter():
+            return SuppressionFilter.load(self.index_path)
+        snapshot = emailCanon.EmailSet(self._readLines(self.snapshot_path))
+        return self._saveFilter(snapshot)
+
+    def _snapshotNewerThanFilter(self):
+        if not os.path.exists(self.snapshot_path):
+            return False
+        keys_path = os.path.join(self.index_path, KEYS_FILE)
+        return os.path.getmtime(self.snapshot_path) > os.path.getmtime(keys_path)
+
+    def _saveFilter(self, emails):
+        keys = np.fromiter(emails.emails.keys(), dtype = np.uint64, count = len(emails))
+        SuppressionFilter.fromKeys(keys, emailCanon.keyScheme()).save(self.index_path)
+        return SuppressionFilter.load(self.index_path)
+
+    @property
+    def emails(self):
+        """EmailSet of every suppressed email; reads the whole snapshot the first time."""
+        if self._emails is None:
+            self._emails = emailCanon.EmailSet(self._readLines(self.snapshot_path))
+            self._emails.update(self.recent)
+        return self._emails
+
+    def _readLines(self, path):
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as file:
+            return [line.rstrip('\n') for line in file if line.strip()]
+
+    def _excelSignature(self):
+        if not os.path.exists(self.excel_path):
+            return None
+        return contactStore.getExcelSignature(self.excel_path)
+
+    def _recordExcelSignature(self):
+        with open(self.source_path, 'w') as file:
+            json.dump(self._excelSignature(), file)
+
+    def syncFromExcel(self):
+        """Merge in emails from the workbook if it changed since it was last seen."""
+        signature = self._excelSignature()
+        if signature is None:
+            return 0
+        if os.path.exists(self.source_path):
+            with open(self.source_path, 'r') as file:
+                if json.load(file) == signature:
+                    return 0
+        # Headers go through the contact schema, so 'Email' or 'E-mail' count as EMAIL on every sheet
+        emails = [df['EMAIL'] for df in map(contactSchema.rename_frame_columns, contactStore.readSheets(self.excel_path, ['EMAIL']))
+                  if 'EMAIL' in df.columns]
+        if not emails:
+            raise ValueError(self.excel_path + " has no EMAIL column to suppress")
+        added = self.add(pd.concat(emails, ignore_index = True))
+        # Only recorded once the emails are in, so a failed import is retried next time
+        self._recordExcelSignature()
+        return added
+
+    def reader(self):
+        """A SuppressionReader of the index as it stands, cheap to hand to another process."""
+        return SuppressionReader(self.index_path, self.recent)
+
+    def containsKeys(self, keys):
+        """Boolean array: which emailCanon keys are suppressed."""
+        return self.filter.containsKeys(keys) | self.recent.containsKeys(keys)
+
+    def containsEmails(self, emails):
+        return self.containsKeys(emailCanon.emailKeys(emails))
+
+    def __contains__(self, email):
+        return bool(self.containsEmails([email])[0])
+
+    def __len__(self):
+        return len(self.filter) + len(self.recent)
+
+    def add(self, emails):
+        """Append any emails not already suppressed to the log. Returns how many were new."""
+        candidates = emails if isinstance(emails, emailCanon.EmailSet) else emailCanon.EmailSet(emails)
+        keys = np.fromiter(candidates.emails.keys(), dtype = np.uint64, count = len(candidates))
+        unseen = ~self.filter.containsKeys(keys)
+        new_emails = self.recent.update([email for email, is_new in zip(candidates, unseen) if is_new])
+        if self._emails is not None:
+            self._emails.update(new_emails)
+        if new_emails:
+            with open(self.log_path, 'a') as file:
+                file.write('\n'.join(new_emails) + '\n')
+            self.log_entries += len(new_emails)
+        return len(new_emails)
+
+    def compact(self):
+        """Fold the log into a fresh sorted snapshot."""
+        temp_path = self.snapshot_path + '.tmp'
+        emails = self.emails
+        with open(temp_path, 'w') as file:
+            for email in sorted(emails):
+                file.write(email + '\n')
+        os.replace(temp_path, self.snapshot_path)
+        self.filter = None  # Drop the old mappings before their files are replaced
+        self.filter = self._saveFilter(emails)
+        open(self.log_path, 'w').close()
+        self.recent = emailCanon.EmailSet()
+        self.log_entries = 0
+
+    def exportToExcel(self, output_path = None):
+        output_path = output_path or self.excel_path
+        dne_df = pd.DataFrame(sorted(self.emails), columns = ['EMAIL'])
+        with pd.ExcelWriter(output_path, engine = 'openpyxl', mode = 'w') as writer:
+            dne_df.to_excel(writer, sheet_name = 'DNE', index = False)
+        if os.path.abspath(output_path) == os.path.abspath(self.excel_path):
+            self._recordExcelSignature()
+        print("Exported " + str(len(dne_df)) + " suppressed emails to " + output_path)
+
+class SuppressionReader:
+    """Read-only view of a SuppressionIndex for worker processes.
+
+    Maps the snapshot's key files and checks the log's emails as they were when
+    the view was taken; it never syncs, compacts or writes anything. Pickling
+    sends only the index path and the log, and unpickling maps the files again.
+    """
+
+    def __init__(self, index_path, recent):
+        self.index_path = index_path
+        self.recent = recent
+        self.filter = SuppressionFilter.load(index_path)
+
+    def __getstate__(self):
+        return {'index_path': self.index_path, 'recent': self.recent}
+
+    def __setstate__(self, state):
+        self.__init__(state['index_path'], state['recent'])
+
+    def containsKeys(self, keys):
+        return self.filter.containsKeys(keys) | self.recent.containsKeys(keys)
+
+    def containsEmails(self, emails):
+        return self.containsKeys(emailCanon.emailKeys(emails))
+
+def getSuppressionIndex(excel_path):
+    key = os.path.abspath(excel_path)
+    if key not in _INDEXES:
+        _INDEXES[key] = SuppressionIndex(excel_path)
+    return _INDEXES[key]
@@ -0,0 +1,80 @@
+import re
+import pandas as pd
+
+# Minimal {{FIELD}} template engine for emailTemplate.html and Gmail drafts.
+# A template is parsed once into literal and field segments; rendering is a
+# join over those segments, either for one recipient or column-wise over a
+# whole DataFrame.
+
+PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+HTML_ESCAPES = [('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'), ("'", '&#x27;')]
+
+# Paragraphs gptCalls can generate per lead; rendered empty when a sheet has no such column.
+CUSTOM_FIELDS = ['NICHE_CUSTOM', 'PASTEXPERIENCE_CUSTOM']
+DEFAULTS = {'FIRST': 'there', **{field: '' for field in CUSTOM_FIELDS}}
+
+def escape_html(text):
+    for char, entity in HTML_ESCAPES:
+        text = text.replace(char, entity)
+    return text
+
+def escape_html_series(values):
+    for char, entity in HTML_ESCAPES:
+        values = values.str.replace(char, entity, regex=False)
+    return values
+
+def first_names(names):
+    return names.where(names.notna(), '').astype(str).str.strip().str.split().str[0]
+
+class Template:
+    def __init__(self, text, defaults=None, escape=True):
+        self.segments = PLACEHOLDER.split(text)
+        self.fields = list(dict.fromkeys(self.segments[1::2]))
+        self.defaults = dict(DEFAULTS if defaults is None else defaults)
+        self.escape = escape
+
+    @classmethod
+    def from_file(cls, path, defaults=None, escape=True):
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(file.read(), defaults, escape)
+
+    def missing_fields(self, available):
+        """Fields the template uses that are neither in `available` nor have a default."""
+        return [field for field in self.fields if field not in available and field not in self.defaults]
+
+    def _value(self, values, field):
+        value = values.get(field)
+        if value is None or (isinstance(value, float) and value != value) or str(value).strip() == '':
+            value = self.defaults.get(field, '')
+        value = str(value)
+        return escape_html(value) if self.escape else value
+
+    def render(self, values, strict=True):
+        missing = self.missing_fields(values.keys())
+        if missing and strict:
+            raise KeyError(f"template fields with no value: {', '.join(missing)}")
+        return ''.join(segment if n % 2 == 0 else self._value(values, segment) for n, segment in enumerate(self.segments))
+
+    def _column(self, df, field):
+        if field in df.columns:
+            column = df[field]
+        elif field == 'FIRST' and 'NAME' in df.columns:
+            column = first_names(df['NAME'])
+        else:
+            return escape_html(self.defaults.get(field, '')) if self.escape else self.defaults.get(field, '')
+        column = column.where(column.notna(), '').astype(str)
+        column = column.where(column.str.strip() != '', self.defaults.get(field, ''))
+        return escape_html_series(column) if self.escape else column
+
+    def render_frame(self, df, strict=True):
+        """Render one body per row, column-wise. FIRST falls back to the first word of NAME."""
+        available = set(df.columns) | ({'FIRST'} if 'NAME' in df.columns else set())
+        missing = self.missing_fields(available)
+        if missing and strict:
+            raise KeyError(f"template fields missing from the sheet: {', '.join(missing)}")
+
+        columns = {field: self._column(df, field) for field in self.fields}
+        rendered = pd.Series(self.segments[0], index=df.index, dtype=object)
+        for n in range(1, len(self.segments), 2):
+            rendered = rendered + columns[self.segments[n]] + self.segments[n + 1]
+        return rendered